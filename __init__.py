@@ -1,7 +1,23 @@
-from aqt import mw
+import sys
+
+from aqt import gui_hooks, mw
 from aqt.qt import QAction
-from .ui import launch_timewarp
+
+
+def launch_timewarp():
+    # ui pulls in QtWebEngine, core and the chart page, so it is only
+    # imported the first time the tool is opened, not at Anki startup.
+    from .ui import launch_timewarp
+    launch_timewarp()
+
+
+def discard_dialog():
+    ui = sys.modules.get(f"{__name__}.ui")
+    if ui is not None:
+        ui.discard_dialog()
+
 
 action = QAction("Anki Time Warp", mw)
 action.triggered.connect(launch_timewarp)
 mw.form.menuTools.addAction(action)
+gui_hooks.profile_will_close.append(discard_dialog)
@@ -0,0 +1,251 @@
+"""
+Anki Time Warp – Batch mode
+
+Warps many .anki2 collection files without a running Anki, one worker
+process per collection.  Each worker opens its file with
+anki.collection.Collection, runs the same fetch → simulate → apply path
+as the dialog through core.use_collection(), and reports a summary.
+
+    python batch.py learner1.anki2 learner2.anki2 --stretch 80 --shift 3
+    python batch.py *.anki2 --deck "Spanish" --cap 0 --dry-run --diff-dir diffs
+    python batch.py col.anki2 --group "Med::Pathology:stretch=50,cap=40" \
+        --group "Med::Pharmacology:shift=3" --budget 150
+
+Close Anki (or at least the profile) before warping its collection: the
+file must not be open anywhere else.  --dry-run leaves the files
+untouched; --diff-dir writes one CSV of changed cards per collection.
+Each --group warps one deck with its own settings (core.simulate_groups),
+all groups together staying under the --budget reviews per day.
+"""
+
+import argparse
+import csv
+import importlib
+import json
+import os
+import sys
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+if __package__:
+    from . import core
+else:
+    # Run as a script: import the add-on's modules through a stand-in
+    # package, as the add-on's own __init__ needs a running Anki.  This
+    # also runs in spawned workers, which re-import the main script.
+    _package = types.ModuleType("anki_time_warp")
+    _package.__path__ = [os.path.dirname(os.path.abspath(__file__))]
+    sys.modules.setdefault("anki_time_warp", _package)
+    core = importlib.import_module("anki_time_warp.core")
+
+
+# Simulation parameters understood by warp_collection(); the keys are
+# simulate_review_timeline() keyword arguments.
+DEFAULT_PARAMS = {
+    "stretch_pct": 0,
+    "shift": 0,
+    "horizon_past": 30,
+    "horizon_future": 90,
+    "fit_horizon": True,
+    "collapse_overdues": False,
+    "max_cards_per_day": -1,
+    "max_displacement": None,
+}
+
+
+# --group setting names → simulate_review_timeline() keywords.
+GROUP_KEYS = {
+    "stretch": "stretch_pct",
+    "shift": "shift",
+    "cap": "max_cards_per_day",
+    "max_early": "max_displacement",
+}
+
+
+def parse_group(spec):
+    """
+    "Deck[:stretch=S,shift=D,cap=C,max_early=E]" → (deck, params).
+    The deck name may itself contain "::"; settings follow the last ":".
+    """
+    deck, params = spec, {}
+    head, sep, tail = spec.rpartition(":")
+    if sep and "=" in tail and not head.endswith(":"):
+        deck = head
+        for item in tail.split(","):
+            key, _, value = item.partition("=")
+            key = key.strip()
+            if key not in GROUP_KEYS:
+                raise argparse.ArgumentTypeError(
+                    f"unknown group setting {key!r} (use {', '.join(GROUP_KEYS)})")
+            try:
+                params[GROUP_KEYS[key]] = int(value)
+            except ValueError:
+                raise argparse.ArgumentTypeError(f"{key} needs a whole number, got {value!r}")
+    return deck, params
+
+
+def simulate(params, deck, tags, groups=None, daily_budget=-1):
+    """
+    Load and simulate the selection; returns the simulated batches – one,
+    or one per (deck, params) group under the shared *daily_budget*.
+    """
+    if not groups:
+        batch = core.load_card_batch(core.fetch_cards(deck, list(tags)))
+        core.simulate_review_timeline(batch, **params)
+        return [batch]
+    defaults = {key: value for key, value in params.items()
+                if key not in core.SHARED_GROUP_PARAMS}
+    jobs = [(core.load_card_batch(core.fetch_cards(group_deck, list(tags))),
+             dict(defaults, **group_params))
+            for group_deck, group_params in groups]
+    return core.simulate_groups(
+        jobs, daily_budget, params["horizon_past"], params["horizon_future"],
+        fit_horizon=params["fit_horizon"])
+
+
+def changed_cards(batch):
+    """(cid, old due, new due) of every placed card whose due date moves."""
+    cids, old_dues, new_dues = core.due_date_diff(batch)
+    return [(int(cid), int(old), int(new))
+            for cid, old, new in zip(cids, old_dues, new_dues)]
+
+
+def write_diff(path, changes):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(("cid", "old_due", "new_due", "days_moved"))
+        for cid, old, new in changes:
+            writer.writerow((cid, old, new, new - old))
+
+
+def warp_collection(path, params, deck="All", tags=(), dry_run=False,
+                    diff_dir=None, groups=None, daily_budget=-1):
+    """
+    Warp one collection file and return its summary dict.
+
+    Errors are caught and reported in the summary ("error") so one
+    unreadable or locked file does not stop the rest of the batch.
+    """
+    from anki.collection import Collection
+
+    summary = {"collection": path, "dry_run": dry_run}
+    start = time.perf_counter()
+    try:
+        col = Collection(path)
+    except Exception as exc:
+        summary["error"] = f"{type(exc).__name__}: {exc}"
+        return summary
+    try:
+        with core.use_collection(col):
+            batches = simulate(params, deck, tags, groups, daily_budget)
+            changes = [change for batch in batches for change in changed_cards(batch)]
+            moved = [abs(new - old) for _, old, new in changes]
+            hist = [sum(day) for day in zip(*(batch.histogram() for batch in batches))]
+            summary.update(
+                cards=sum(len(batch) for batch in batches),
+                placed=sum(int(len(batch.placed_indices())) for batch in batches),
+                changed=len(changes),
+                mean_days_moved=round(sum(moved) / len(moved), 2) if moved else 0,
+                max_days_moved=max(moved, default=0),
+                peak_per_day=max(hist, default=0),
+            )
+            if diff_dir:
+                name = os.path.splitext(os.path.basename(path))[0]
+                diff_path = os.path.join(diff_dir, f"{name}.diff.csv")
+                write_diff(diff_path, changes)
+                summary["diff"] = diff_path
+            if not dry_run:
+                summary["written"] = core.write_due_dates(
+                    [cid for cid, _, _ in changes], [new for _, _, new in changes])
+    except Exception as exc:
+        summary["error"] = f"{type(exc).__name__}: {exc}"
+    finally:
+        col.close()
+    summary["seconds"] = round(time.perf_counter() - start, 3)
+    return summary
+
+
+def warp_collections(paths, params=None, deck="All", tags=(), dry_run=False,
+                     diff_dir=None, workers=None, groups=None, daily_budget=-1):
+    """
+    Warp every collection in *paths* in a pool of *workers* processes
+    (default: one per core).  Yields summaries in completion order.
+    """
+    params = dict(DEFAULT_PARAMS, **(params or {}))
+    if diff_dir:
+        os.makedirs(diff_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(warp_collection, path, params, deck, tuple(tags),
+                               dry_run, diff_dir, groups, daily_budget)
+                   for path in paths]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("collections", nargs="+", help=".anki2 files to warp")
+    parser.add_argument("--deck", default="All")
+    parser.add_argument("--tag", action="append", default=[], dest="tags")
+    parser.add_argument("--stretch", type=int, default=0, help="stretch in percent")
+    parser.add_argument("--shift", type=int, default=0, help="shift in days")
+    parser.add_argument("--cap", type=int, default=-1,
+                        help="max cards/day: -1 off, 0 auto, >0 manual")
+    parser.add_argument("--max-early", type=int, default=None,
+                        help="max days a review may be moved earlier")
+    parser.add_argument("--collapse-overdues", action="store_true")
+    parser.add_argument("--horizon-past", type=int, default=30)
+    parser.add_argument("--horizon-future", type=int, default=90)
+    parser.add_argument("--fixed-horizon", action="store_true",
+                        help="leave cards due outside the horizons alone instead "
+                             "of widening the window to cover them")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="simulate and report, but write nothing")
+    parser.add_argument("--diff-dir", default=None,
+                        help="write <collection>.diff.csv of changed cards here")
+    parser.add_argument("--group", action="append", default=[], dest="groups",
+                        type=parse_group, metavar="DECK[:KEY=N,...]",
+                        help="warp DECK with its own settings (stretch, shift, cap, "
+                             "max_early; the rest come from the options above) instead "
+                             "of --deck; repeat for each group; groups must not overlap")
+    parser.add_argument("--budget", type=int, default=-1,
+                        help="reviews per day shared by all --group decks, -1 off")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--json", action="store_true",
+                        help="print one JSON summary per line")
+    args = parser.parse_args(argv)
+    overlap = core.overlapping_decks([deck for deck, _ in args.groups])
+    if overlap:
+        parser.error(f'--group decks "{overlap[0]}" and "{overlap[1]}" overlap')
+
+    params = {
+        "stretch_pct": args.stretch,
+        "shift": args.shift,
+        "horizon_past": args.horizon_past,
+        "horizon_future": args.horizon_future,
+        "fit_horizon": not args.fixed_horizon,
+        "collapse_overdues": args.collapse_overdues,
+        "max_cards_per_day": args.cap,
+        "max_displacement": args.max_early,
+    }
+    failed = 0
+    for summary in warp_collections(args.collections, params, args.deck,
+                                    args.tags, args.dry_run, args.diff_dir,
+                                    args.workers, args.groups, args.budget):
+        failed += "error" in summary
+        if args.json:
+            print(json.dumps(summary))
+        elif "error" in summary:
+            print(f"{summary['collection']}: FAILED – {summary['error']}")
+        else:
+            action = "would move" if args.dry_run else "moved"
+            print(f"{summary['collection']}: {action} {summary['changed']} of "
+                  f"{summary['cards']} cards (mean {summary['mean_days_moved']} days, "
+                  f"max {summary['max_days_moved']}), peak {summary['peak_per_day']}/day, "
+                  f"{summary['seconds']}s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
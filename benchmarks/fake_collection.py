@@ -0,0 +1,213 @@
+"""
+Anki Time Warp – Fake collection for benchmarks
+
+A small stand-in for mw.col backed by an in-memory SQLite cards table,
+so the core pipeline can be timed outside a running Anki.  It covers
+what core.py touches: find_cards, db.all, get_card, update_card(s),
+sched.today, mod, the custom undo entry calls and save.
+
+Synthetic due-date distributions:
+  backlog  – heavy overdue backlog on top of a normal future load
+  cram     – exam-cram spikes a few days and weeks out
+  mature   – long intervals spread over the next year, few overdues
+  learning – a normal review load plus cards in (re)learning; intraday
+             learning cards (queue 1) are due at an epoch timestamp,
+             interday ones (queue 3) on a day number
+"""
+
+import math
+import random
+import re
+import sqlite3
+
+
+DISTRIBUTIONS = ("backlog", "cram", "mature", "learning")
+
+# Share of the review cards of the "learning" distribution that are in
+# intraday or interday learning.
+LEARNING_SHARE = 0.1
+
+# Epoch seconds of the fake collection's day 0.
+DAY_ZERO_EPOCH = 1_700_000_000 - 1000 * 86400
+
+# Share of generated cards that are new.
+NEW_SHARE = 0.2
+
+
+class FakeCard:
+    __slots__ = ("id", "did", "due", "ivl", "type", "queue", "odue", "odid")
+
+    def __init__(self, id, did, due, ivl, type, queue, odue=0, odid=0):
+        self.id = id
+        self.did = did
+        self.due = due
+        self.ivl = ivl
+        self.type = type
+        self.queue = queue
+        self.odue = odue
+        self.odid = odid
+
+
+class FakeDB:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def all(self, sql, *args):
+        return [list(row) for row in self._conn.execute(sql, args)]
+
+    def list(self, sql, *args):
+        return [row[0] for row in self._conn.execute(sql, args)]
+
+    def scalar(self, sql, *args):
+        row = self._conn.execute(sql, args).fetchone()
+        return row[0] if row else None
+
+    def execute(self, sql, *args):
+        self._conn.execute(sql, args)
+
+
+class FakeScheduler:
+    def __init__(self, today):
+        self.today = today
+
+
+class FakeCollection:
+    """
+    Cards live in an SQLite `cards` table with the columns core.py reads.
+    Each deck name maps to a deck id; search supports `deck:"name"` and
+    `-is:suspended`, which is all fetch_cards() produces without tags.
+    """
+
+    def __init__(self, rows, decks, today=1000):
+        self._conn = sqlite3.connect(":memory:")
+        self._conn.execute(
+            "create table cards (id integer primary key, did integer, "
+            "due integer, ivl integer, type integer, queue integer, "
+            "odue integer, odid integer, mod integer, usn integer)")
+        self._conn.executemany(
+            "insert into cards values (?, ?, ?, ?, ?, ?, 0, 0, 0, 0)", rows)
+        self._decks = dict(decks)
+        self._mod = 0
+        self._undo = []
+        self.db = FakeDB(self._conn)
+        self.sched = FakeScheduler(today)
+
+    @property
+    def mod(self):
+        return self._mod
+
+    def find_cards(self, query, order=False):
+        sql = "select id from cards where 1"
+        args = []
+        deck = re.search(r'deck:"([^"]*)"', query)
+        if deck:
+            sql += " and did = ?"
+            args.append(self._decks.get(deck.group(1), -1))
+        if "-is:suspended" in query:
+            sql += " and queue != -1"
+        return self.db.list(sql, *args)
+
+    def count_matching_cards(self, query):
+        return len(self.find_cards(query))
+
+    def get_card(self, cid):
+        row = self._conn.execute(
+            "select id, did, due, ivl, type, queue, odue, odid from cards where id = ?",
+            (cid,)).fetchone()
+        return FakeCard(*row)
+
+    def update_card(self, card):
+        self.update_cards([card])
+
+    def update_cards(self, cards, skip_undo_entry=False):
+        cards = list(cards)
+        if not skip_undo_entry:
+            ids = ",".join(str(card.id) for card in cards)
+            self._undo.append(("Update Card", self.db.all(
+                f"select id, due from cards where id in ({ids})")))
+        self._mod += 1
+        self._conn.executemany(
+            "update cards set due = ?, ivl = ?, type = ?, queue = ?, odue = ?, "
+            "mod = ? where id = ?",
+            [(c.due, c.ivl, c.type, c.queue, c.odue, self._mod, c.id) for c in cards])
+
+    def add_custom_undo_entry(self, name):
+        self._undo.append((name, []))
+        return len(self._undo)
+
+    def merge_undo_entries(self, target):
+        name, merged = self._undo[target - 1]
+        for _, entries in self._undo[target:]:
+            merged.extend(entries)
+        del self._undo[target:]
+
+    def undo(self):
+        name, entries = self._undo.pop()
+        self._conn.executemany("update cards set due = ? where id = ?",
+                               [(due, cid) for cid, due in reversed(entries)])
+        self._mod += 1
+        return name
+
+    def save(self):
+        pass
+
+    def close(self):
+        self._conn.close()
+
+
+# ===== Synthetic collections ================================================
+
+def _review_due(rng, distribution, today):
+    """One review card's (due, ivl) for *distribution*."""
+    if distribution == "backlog":
+        if rng.random() < 0.6:
+            return today - int(rng.expovariate(1 / 30.0)) - 1, rng.randint(1, 60)
+        return today + rng.randint(0, 90), rng.randint(1, 90)
+    if distribution == "cram":
+        spike = rng.random()
+        if spike < 0.35:
+            return today + max(0, int(rng.gauss(7, 1.5))), rng.randint(1, 10)
+        if spike < 0.6:
+            return today + max(0, int(rng.gauss(21, 2))), rng.randint(5, 25)
+        return today + rng.randint(-10, 90), rng.randint(1, 60)
+    if distribution == "learning":
+        return today + rng.randint(-5, 60), rng.randint(1, 60)
+    # mature
+    ivl = int(math.exp(rng.uniform(math.log(30), math.log(700))))
+    if rng.random() < 0.05:
+        return today - rng.randint(1, 20), ivl
+    return today + rng.randint(0, min(ivl, 365)), ivl
+
+
+def make_collection(n_cards, distribution="backlog", n_decks=5, today=1000,
+                    seed=0):
+    """
+    A FakeCollection with *n_cards* cards spread over *n_decks* decks.
+
+    About NEW_SHARE of the cards are new, one in fifty is suspended;
+    review due dates follow *distribution*.
+    """
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f"unknown distribution {distribution!r}")
+    rng = random.Random(seed)
+    decks = {f"Deck {i + 1}": i + 1 for i in range(n_decks)}
+    first_id = 1_600_000_000_000
+    rows = []
+    for offset in range(n_cards):
+        did = rng.randint(1, n_decks)
+        if rng.random() < NEW_SHARE:
+            due, ivl, ctype, queue = offset, 0, 0, 0
+        else:
+            due, ivl = _review_due(rng, distribution, today)
+            ctype, queue = 2, 2
+            if distribution == "learning" and rng.random() < LEARNING_SHARE:
+                if rng.random() < 0.5:
+                    ctype, queue = rng.choice((1, 3)), 1
+                    due = DAY_ZERO_EPOCH + today * 86400 + rng.randint(60, 3600)
+                else:
+                    ctype, queue = 3, 3
+                    due = today + rng.randint(0, 2)
+        if rng.random() < 0.02:
+            queue = -1
+        rows.append((first_id + offset, did, due, ivl, ctype, queue))
+    return FakeCollection(rows, decks, today=today)
@@ -0,0 +1,168 @@
+"""
+Anki Time Warp – Pipeline benchmarks
+
+Times every stage of the core pipeline against synthetic collections
+(see fake_collection.py) and writes a JSON report, so runs from
+different versions can be compared.
+
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --sizes 1000 10000 --output before.json
+    python benchmarks/run_benchmarks.py --no-numpy
+
+Measured per (distribution, size):
+  fetch        – fetch_cards()
+  load         – load_card_batch()
+  <stage>      – each SimulationPipeline stage on a cold run
+  rescrub      – a second run with only the shift changed
+  apply        – apply_transformed_due_dates(), including the undo entry
+
+With NumPy available, the NumPy stretch + rounding kernels are also
+checked against the pure-Python ones on random histograms; any trial
+where the rounded placements differ is reported.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import platform
+import random
+import sys
+import time
+import types
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ADDON_DIR = os.path.dirname(BENCH_DIR)
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+
+# Parameters of the simulated warp: positive stretch, a shift, the
+# automatic cap, and the window fitted to the cards as the dialog does.
+WARP = {"stretch_pct": 80, "shift": 3, "collapse_overdues": False,
+        "max_cards_per_day": 0, "fit_horizon": True}
+
+
+def load_core():
+    """
+    Import the add-on's core module without running its __init__, which
+    needs a running Anki.
+    """
+    package = types.ModuleType("anki_time_warp")
+    package.__path__ = [ADDON_DIR]
+    sys.modules.setdefault("anki_time_warp", package)
+    return importlib.import_module("anki_time_warp.core")
+
+
+def timed(timings, name, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    timings[name] = time.perf_counter() - start
+    return result
+
+
+def bench_one(core, fake_collection, distribution, size, apply_limit):
+    col = fake_collection.make_collection(size, distribution)
+    timings = {}
+    with core.use_collection(col):
+        cids = timed(timings, "fetch", core.fetch_cards, "All", [])
+        batch = timed(timings, "load", core.load_card_batch, cids)
+
+        pipeline = core.SimulationPipeline()
+        pipeline.run(batch, col.sched.today, **WARP)
+        timings.update(pipeline.timings)
+
+        rescrub = dict(WARP, shift=WARP["shift"] + 1)
+        start = time.perf_counter()
+        pipeline.run(batch, col.sched.today, **rescrub)
+        timings["rescrub"] = time.perf_counter() - start
+
+        if size <= apply_limit:
+            timed(timings, "apply", core.apply_transformed_due_dates, batch)
+    col.close()
+    return {
+        "distribution": distribution,
+        "cards": size,
+        "placed": int(len(batch.placed_indices())),
+        "horizon": batch.horizon,
+        "seconds": {name: round(value, 6) for name, value in timings.items()},
+    }
+
+
+def check_kernels(core, trials, seed=0):
+    """
+    Stretch random histograms with both kernels and round them with both
+    rounding paths.  Returns the (stretch_pct, pivot) of every trial where
+    the NumPy and pure-Python placements differ.
+    """
+    rng = random.Random(seed)
+    mismatches = []
+    for _ in range(trials):
+        n = rng.randint(20, 200)
+        pivot = rng.randint(0, n - 1)
+        hist = [rng.choice((0, 0, 1, 2, 3, rng.randint(0, 50))) for _ in range(n)]
+        total = sum(hist)
+        stretch_pct = rng.randint(-50, 300)
+        factor = 1.0 + stretch_pct / 100.0
+        placed_py = core._stochastic_round_py(
+            core._stretch_histogram_py(hist, factor, pivot), total, random.Random(42))
+        placed_np = core._stochastic_round_np(
+            core._stretch_histogram_np(hist, factor, pivot), total, random.Random(42))
+        if placed_py != placed_np:
+            mismatches.append((stretch_pct, pivot))
+    return mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--distributions", nargs="+", default=None)
+    parser.add_argument("--apply-limit", type=int, default=100000,
+                        help="skip the apply step above this many cards")
+    parser.add_argument("--no-numpy", action="store_true",
+                        help="benchmark the pure-Python fallback")
+    parser.add_argument("--output", default="benchmark_report.json")
+    parser.add_argument("--check-trials", type=int, default=3000,
+                        help="random histograms for the NumPy / Python kernel check")
+    args = parser.parse_args(argv)
+
+    if args.no_numpy:
+        sys.modules["numpy"] = None
+    sys.path.insert(0, BENCH_DIR)
+    import fake_collection
+
+    core = load_core()
+    with open(os.path.join(ADDON_DIR, "manifest.json"), encoding="utf-8") as f:
+        version = json.load(f).get("version")
+
+    results = []
+    for distribution in args.distributions or fake_collection.DISTRIBUTIONS:
+        for size in args.sizes:
+            result = bench_one(core, fake_collection, distribution, size,
+                               args.apply_limit)
+            results.append(result)
+            stages = "  ".join(f"{name}={secs * 1000:.1f}ms"
+                               for name, secs in result["seconds"].items())
+            print(f"{distribution:8s} {size:>8d}  {stages}")
+
+    mismatches = None
+    if core.np is not None:
+        mismatches = check_kernels(core, args.check_trials)
+        print(f"kernel check: {len(mismatches)} of {args.check_trials} trials differ "
+              "between the NumPy and pure-Python paths")
+
+    report = {
+        "addon_version": version,
+        "python": platform.python_version(),
+        "numpy": getattr(core.np, "__version__", None),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "warp": WARP,
+        "results": results,
+        "kernel_mismatches": mismatches,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
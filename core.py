@@ -7,14 +7,68 @@ leveled, and reassigned – eliminating sawtooth / gap artefacts.
 
 """
 
-from aqt import mw
+import bisect
+import heapq
 import math
 import random
-from anki.cards import Card
-from anki.decks import DeckId
+import threading
+import time
+from array import array
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from itertools import count
 
+from .instrumentation import NULL_RUN
+
+try:
+    from aqt import mw
+except ImportError:  # headless use (benchmarks, batch mode); see use_collection()
+    mw = None
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; CardBatch falls back to array.array
+    np = None
+
+
+# ===== Collection access ====================================================
+
+_collection = None
+
+
+def _col():
+    """The collection in use: the one set by use_collection(), else mw.col."""
+    return _collection if _collection is not None else mw.col
+
+
+@contextmanager
+def use_collection(col):
+    """Run the core functions against *col* instead of mw.col."""
+    global _collection
+    previous = _collection
+    _collection = col
+    try:
+        yield col
+    finally:
+        _collection = previous
+
+
+# ===== Card fetching ========================================================
+
+CARD_TYPE_NEW = 0
+CARD_TYPE_REVIEW = 1
+
+# Card ids are inlined into the IN (...) list, so large selections are
+# split into several statements to stay clear of SQLite's length limits.
+_LOAD_CHUNK = 20000
+
+# Slot value of a card that is not placed on the simulated timeline.
+NO_SLOT = -1
+
+# fit_horizon: share of the review cards that positive stretch and the
+# automatic cap spread over; the window itself covers all of them.
+FIT_QUANTILE = 0.99
 
-# ===== Card fetching (unchanged) ============================================
 
 def fetch_cards(deck, tags):
     query_parts = []
@@ -25,23 +79,358 @@ def fetch_cards(deck, tags):
             query_parts.append(f'tag:"{tag}"')
     query_parts.append("-is:suspended")
     query = " ".join(query_parts)
-    return mw.col.find_cards(query)
+    return _col().find_cards(query)
 
 
-def get_card_data(cids):
-    data = []
-    for cid in cids:
-        card = mw.col.get_card(cid)
-        if card.queue == -1:
+def load_card_columns(cids):
+    """
+    Bulk-load the scheduling columns of *cids* as compact arrays.
+
+    Only id / due / ivl / type are read, straight from the cards table,
+    in one query per chunk of ids – no Card objects are hydrated.  Cards
+    sitting in a filtered deck report their home deck due (odue), the
+    one write_due_dates() sets for them.
+    Suspended cards (queue == -1) and intraday learning cards (queue 1
+    and 4, whose due is a timestamp rather than a day number) are
+    dropped, and the card type is folded to CARD_TYPE_NEW /
+    CARD_TYPE_REVIEW inside the query.
+
+    Returns a dict of parallel arrays keyed "cid", "due", "ivl", "type".
+    """
+    columns = {
+        "cid": array("q"),
+        "due": array("q"),
+        "ivl": array("i"),
+        "type": array("b"),
+    }
+    ids = sorted(cids)
+    for start in range(0, len(ids), _LOAD_CHUNK):
+        id_list = ",".join(str(int(cid)) for cid in ids[start:start + _LOAD_CHUNK])
+        rows = _col().db.all(
+            "select id, case when odid then odue else due end, ivl, type != 0 from cards "
+            f"where id in ({id_list}) and queue not in (-1, 1, 4) order by id"
+        )
+        if not rows:
             continue
-        data.append({
-            "cid": card.id,
-            "due": card.due,
-            "ivl": card.ivl,
-            "type": "new" if card.type == 0 else "review",
-            "review_timeline": [],
-        })
-    return data
+        cid_col, due_col, ivl_col, type_col = zip(*rows)
+        columns["cid"].extend(cid_col)
+        columns["due"].extend(due_col)
+        columns["ivl"].extend(ivl_col)
+        columns["type"].extend(type_col)
+    return columns
+
+
+def load_card_decks(cids):
+    """
+    Deck id of each card in *cids*, in the same order, as an array –
+    one query per chunk of ids, for views that group or filter by deck.
+    Cards that no longer exist get deck id 0.
+    """
+    decks = {}
+    ids = [int(cid) for cid in cids]
+    for start in range(0, len(ids), _LOAD_CHUNK):
+        id_list = ",".join(str(cid) for cid in ids[start:start + _LOAD_CHUNK])
+        decks.update(_col().db.all(f"select id, did from cards where id in ({id_list})"))
+    return _int_array("q", [decks.get(cid, 0) for cid in ids])
+
+
+def load_card_batch(cids):
+    return CardBatch.from_columns(load_card_columns(cids))
+
+
+def get_card_data(cids):
+    """List-of-dicts view of load_card_batch(), kept for older callers."""
+    return load_card_batch(cids).to_dicts()
+
+
+# ===== Card batches =========================================================
+
+_NP_DTYPES = {"q": "int64", "i": "int32", "b": "int8"}
+
+# Source of CardBatch.token values.
+_batch_tokens = count()
+
+
+def _int_array(typecode, values):
+    if np is not None:
+        return np.array(values, dtype=_NP_DTYPES[typecode])
+    return array(typecode, values)
+
+
+def _filled_array(typecode, value, n):
+    if np is not None:
+        return np.full(n, value, dtype=_NP_DTYPES[typecode])
+    return array(typecode, [value]) * n
+
+
+class CardBatch:
+    """
+    Parallel typed arrays for a card selection.
+
+    Fields are NumPy arrays when NumPy is importable and array.array
+    otherwise:
+
+      cid, due, ivl   – as loaded; `due` is rewritten by the simulation
+      type            – CARD_TYPE_NEW / CARD_TYPE_REVIEW
+      original_due    – due date before any simulation
+      slot            – timeline slot, NO_SLOT if not placed
+      horizon         – length of the last simulated timeline
+      first_day       – day number of slot 0 of that timeline
+      token           – identifies the loaded contents; copies share it,
+                        and it changes whenever cid/type/original_due do
+    """
+
+    __slots__ = ("cid", "due", "ivl", "type", "original_due", "slot", "horizon",
+                 "token", "first_day")
+
+    def __init__(self, cid, due, ivl, ctype, original_due=None, slot=None,
+                 horizon=0, token=None, first_day=0):
+        self.cid = _int_array("q", cid)
+        self.due = _int_array("q", due)
+        self.ivl = _int_array("i", ivl)
+        self.type = _int_array("b", ctype)
+        self.original_due = _int_array(
+            "q", due if original_due is None else original_due)
+        self.slot = (_filled_array("q", NO_SLOT, len(self.cid))
+                     if slot is None else _int_array("q", slot))
+        self.horizon = horizon
+        self.token = next(_batch_tokens) if token is None else token
+        self.first_day = first_day
+
+    def touch(self):
+        """Mark the loaded contents as changed (drops memoized stages)."""
+        self.token = next(_batch_tokens)
+
+    @classmethod
+    def from_columns(cls, columns):
+        return cls(columns["cid"], columns["due"], columns["ivl"],
+                   columns["type"])
+
+    @classmethod
+    def from_dicts(cls, card_data):
+        return cls(
+            [c["cid"] for c in card_data],
+            [c["due"] for c in card_data],
+            [c.get("ivl", 0) for c in card_data],
+            [CARD_TYPE_REVIEW if c["type"] == "review" else CARD_TYPE_NEW
+             for c in card_data],
+            original_due=[c.get("original_due", c["due"]) for c in card_data],
+            slot=[c.get("slot", NO_SLOT) for c in card_data],
+        )
+
+    def to_dicts(self):
+        return [
+            {
+                "cid": int(cid),
+                "due": int(due),
+                "ivl": int(ivl),
+                "type": "review" if ctype == CARD_TYPE_REVIEW else "new",
+                "original_due": int(original),
+                "slot": int(slot),
+            }
+            for cid, due, ivl, ctype, original, slot in zip(
+                self.cid, self.due, self.ivl, self.type,
+                self.original_due, self.slot)
+        ]
+
+    def update_dicts(self, card_data):
+        """Write the simulated fields back into matching card dicts."""
+        for card, due, ctype, original, slot in zip(
+                card_data, self.due, self.type, self.original_due, self.slot):
+            card["due"] = int(due)
+            card["type"] = "review" if ctype == CARD_TYPE_REVIEW else "new"
+            card["original_due"] = int(original)
+            card["slot"] = int(slot)
+
+    def __len__(self):
+        return len(self.cid)
+
+    def copy(self):
+        return CardBatch(self.cid, self.due, self.ivl, self.type,
+                         self.original_due, self.slot, self.horizon, self.token,
+                         self.first_day)
+
+    def reorder(self, order):
+        """Permute every column in place by the index sequence *order*."""
+        for name in ("cid", "due", "ivl", "type", "original_due", "slot"):
+            column = getattr(self, name)
+            if np is not None:
+                setattr(self, name, column[np.asarray(order, dtype="int64")])
+            else:
+                setattr(self, name, array(column.typecode,
+                                          [column[i] for i in order]))
+        self.touch()
+
+    def placed_indices(self):
+        """Indices of review cards that hold a timeline slot."""
+        if np is not None:
+            return np.nonzero((self.slot != NO_SLOT)
+                              & (self.type == CARD_TYPE_REVIEW))[0]
+        return [i for i, (slot, ctype) in enumerate(zip(self.slot, self.type))
+                if slot != NO_SLOT and ctype == CARD_TYPE_REVIEW]
+
+    def histogram(self, horizon=None):
+        """Per-day card counts of the simulated timeline, in O(N)."""
+        if horizon is None:
+            horizon = self.horizon
+        if np is not None:
+            placed = self.slot[(self.slot >= 0) & (self.slot < horizon)]
+            return np.bincount(placed, minlength=horizon).tolist()
+        counts = [0] * horizon
+        for slot in self.slot:
+            if 0 <= slot < horizon:
+                counts[slot] += 1
+        return counts
+
+
+# ===== Snapshot cache =======================================================
+
+class SnapshotCache:
+    """
+    Bounded LRU of loaded card snapshots, keyed by (deck, tag set).
+
+    Entries are only valid for the collection modification time they
+    were loaded at: when the collection's mod time moves, or after
+    invalidate() (called once a warp has been applied), the whole cache
+    is dropped.  get() hands out copies so callers can simulate on them
+    freely.
+    """
+
+    def __init__(self, max_entries=4):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._col_mod = None
+        self._lock = threading.Lock()
+
+    def get(self, deck, tags, trace=NULL_RUN):
+        """
+        A copy of the snapshot for (deck, tags).  *trace* gets a "fetch"
+        and a "load" stage on a miss, a "snapshot (cached)" one on a hit.
+        """
+        key = (deck, frozenset(tags or ()))
+        col_mod = _col().mod
+        with self._lock:
+            if col_mod != self._col_mod:
+                self._entries.clear()
+                self._col_mod = col_mod
+            batch = self._entries.get(key)
+            if batch is not None:
+                self._entries.move_to_end(key)
+                with trace.stage("snapshot (cached)"):
+                    return batch.copy()
+
+        with trace.stage("fetch"):
+            cids = fetch_cards(deck, tags)
+        with trace.stage("load"):
+            batch = load_card_batch(cids)
+        with self._lock:
+            if col_mod == self._col_mod:
+                self._entries[key] = batch
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return batch.copy()
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._col_mod = None
+
+
+snapshot_cache = SnapshotCache()
+
+
+# ===== Preview cache ========================================================
+
+class PreviewCache:
+    """
+    Bounded LRU of simulated timelines keyed by (stretch_pct, shift), for
+    scrubbing the sliders without waiting for a full preview.
+
+    reset() fixes the snapshot and every other simulation input; when
+    any of them differs from the last reset, or after clear(), all
+    entries are dropped.  precompute() fills the cache for a list of
+    slider positions and is meant to run on a worker thread: it uses its
+    own SimulationPipeline (whose lock it holds per position) and gives
+    up as soon as a newer precompute() or reset() comes in.  Entries are
+    (first_offset, counts): the day of counts[0] relative to today and
+    the per-day counts of the simulated timeline.
+    """
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._context = None
+        self._batch = None
+        self._today = None
+        self._params = {}
+        self._pipeline = SimulationPipeline()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def reset(self, batch, today, **params):
+        """
+        Simulate a copy of *batch* with the non-slider *params* from now
+        on (the keyword arguments of SimulationPipeline.counts() other
+        than stretch_pct and shift).
+        """
+        context = (batch.token, today,
+                   tuple(sorted((name, tuple(value) if isinstance(value, list) else value)
+                                for name, value in params.items())))
+        with self._lock:
+            if context == self._context:
+                return
+            self._entries.clear()
+            self._context = context
+            self._batch = batch.copy()
+            self._today = today
+            self._params = params
+            self._pipeline = SimulationPipeline()
+            self._generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._context = None
+            self._batch = None
+            self._generation += 1
+
+    def get(self, stretch_pct, shift):
+        with self._lock:
+            entry = self._entries.get((stretch_pct, shift))
+            if entry is not None:
+                self._entries.move_to_end((stretch_pct, shift))
+            return entry
+
+    def precompute(self, positions):
+        """
+        Simulate the (stretch_pct, shift) *positions*, in the given order,
+        that are not cached yet.  Returns how many were added.
+        """
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            batch, today = self._batch, self._today
+            params, pipeline = self._params, self._pipeline
+        if batch is None:
+            return 0
+
+        added = 0
+        for stretch_pct, shift in positions:
+            with self._lock:
+                if generation != self._generation:
+                    break
+                if (stretch_pct, shift) in self._entries:
+                    continue
+            first_day, counts = pipeline.timeline(
+                batch, today, stretch_pct=stretch_pct, shift=shift, **params)
+            with self._lock:
+                if generation != self._generation:
+                    break
+                self._entries[(stretch_pct, shift)] = (first_day - today, counts)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            added += 1
+        return added
 
 
 # ===== Main entry point =====================================================
@@ -55,6 +444,11 @@ def simulate_review_timeline(
     collapse_overdues=False,
     max_cards_per_day=-1,
     use_avalanche=False,        # kept for API compat, ignored
+    pipeline=None,
+    day_capacity=None,
+    max_displacement=None,
+    trace=NULL_RUN,
+    fit_horizon=False,
 ):
     """
     Build a stretched, shifted, capped review timeline.
@@ -68,142 +462,485 @@ def simulate_review_timeline(
 
     max_cards_per_day:
       -1 = off (stretch handles redistribution)
-       0 = auto (ceil(total / horizon_future))
+       0 = auto (ceil(total / horizon_future), or over the fitted
+           spread with fit_horizon)
       >0 = manual cap
 
+    day_capacity:
+      optional per-day caps starting today, repeated cyclically (a 7-day
+      list gives a weekly pattern); replaces the flat max_cards_per_day.
+
+    max_displacement:
+      how many days the leveler may pull a review earlier; None = any.
+
+    fit_horizon:
+      widen horizon_past / horizon_future to the due range of the review
+      cards (see fit_horizon_to()); otherwise cards due outside the
+      window are left where they are.
+
     Pipeline:
       1. Build histogram
       2. Collapse overdues if checkbox (or positive stretch)
       3. Stretch: redistribute (positive) or compress (negative)
       4. Shift
       5. Collapse any remaining overdues if checkbox
-      6. Manual cap if set
+      6. Level under the cap if set
       7. Assign cards to slots
+
+    *card_data* is a CardBatch (updated in place) or, for older callers,
+    a list of card dicts that gets the results written back.
+
+    Pass a long-lived SimulationPipeline as *pipeline* to reuse the
+    stages whose inputs did not change since the previous call, and an
+    instrumentation Run as *trace* to record each stage.
     """
-    today = mw.col.sched.today
-    stretch_factor = 1 + (stretch_pct / 100.0)
-    total_range = horizon_past + horizon_future
-    pivot_idx = horizon_past
+    if not isinstance(card_data, CardBatch):
+        batch = CardBatch.from_dicts(card_data)
+        simulate_review_timeline(
+            batch, stretch_pct, shift, horizon_past, horizon_future,
+            collapse_overdues, max_cards_per_day, pipeline=pipeline,
+            day_capacity=day_capacity, max_displacement=max_displacement,
+            trace=trace, fit_horizon=fit_horizon)
+        batch.update_dicts(card_data)
+        return card_data
 
-    # ---- 1. Build histogram ------------------------------------------------
-    for card in card_data:
-        card["original_due"] = card["due"]
-        card["review_timeline"] = []
+    if pipeline is None:
+        pipeline = SimulationPipeline()
+    batch = pipeline.run(
+        card_data, _col().sched.today, stretch_pct=stretch_pct, shift=shift,
+        horizon_past=horizon_past, horizon_future=horizon_future,
+        collapse_overdues=collapse_overdues,
+        max_cards_per_day=max_cards_per_day, day_capacity=day_capacity,
+        max_displacement=max_displacement, trace=trace, fit_horizon=fit_horizon)
+    trace.note(cards_in=pipeline.card_count,
+               cards_out=int(len(batch.placed_indices())),
+               horizon=batch.horizon)
+    return batch
+
+
+def fit_horizon_to(batch, today, horizon_past=30, horizon_future=90, spread=None):
+    """
+    Widen (horizon_past, horizon_future) so the window holds every
+    review card of *batch*, from the most overdue one to the one due
+    last.  Neither side shrinks below the given horizons, so small
+    selections keep the usual 30 / 90 day view.
+
+    Returns (horizon_past, horizon_future, spread).  *spread* (default
+    horizon_future) is widened to the days up to the FIT_QUANTILE of the
+    due dates: positive stretch and the automatic cap even the reviews
+    out over that span only, so a few far-future outliers do not thin
+    out every other day.
+    """
+    if spread is None:
+        spread = horizon_future
+    first, quantile, last = _review_due_range(batch)
+    if first is None:
+        return horizon_past, horizon_future, spread
+    return (max(horizon_past, today - first),
+            max(horizon_future, last - today + 1),
+            max(spread, quantile - today + 1))
 
-    review_cards = []
-    hist = [0] * total_range
-    for card in card_data:
-        if card["type"] != "review":
-            continue
-        rel = card["due"] - today
-        idx = rel + horizon_past
-        if 0 <= idx < total_range:
-            hist[idx] += 1
-            review_cards.append(card)
 
-    if not review_cards:
-        for c in card_data:
-            c["review_timeline"] = [False] * total_range
-        return card_data
+def _review_due_range(batch, quantile=FIT_QUANTILE):
+    """
+    Lowest original due of the review cards, the *quantile* of their
+    original dues and the highest one, or (None, None, None).
+    """
+    if np is not None:
+        dues = np.sort(batch.original_due[batch.type == CARD_TYPE_REVIEW])
+    else:
+        dues = sorted(due for due, ctype in zip(batch.original_due, batch.type)
+                      if ctype == CARD_TYPE_REVIEW)
+    if not len(dues):
+        return None, None, None
+    return (int(dues[0]), int(dues[math.ceil((len(dues) - 1) * quantile)]),
+            int(dues[-1]))
+
+
+# ===== Staged pipeline ======================================================
 
-    total_cards = len(review_cards)
+class SimulationPipeline:
+    """
+    simulate_review_timeline() split into memoized stages.
+
+    Each stage caches its last result under a key built from the key of
+    the stage before it plus its own parameters, so a parameter change
+    only recomputes the stages downstream of it: moving the shift slider
+    reuses the histogram and the stretch rounding, moving the cap reuses
+    everything up to the post-shift collapse.
+
+    After every run `timings` maps stage name → wall time in seconds and
+    `cache_hits` names the stages that were served from cache.  The same
+    measurements go to the instrumentation Run passed to run() as *trace*.
+    """
 
-    # ---- 2. Handle overdues -------------------------------------------------
+    STAGES = ("span", "histogram", "overdue", "stretch", "shift", "collapse",
+              "cap", "assign")
+
+    def __init__(self):
+        self._cache = {}
+        self._lock = threading.Lock()
+        self.timings = {}
+        self.cache_hits = set()
+        self.card_count = 0
+        self.base_hist = []
+        self.window = (0, 0)
+        self._trace = NULL_RUN
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def _stage(self, name, key, compute):
+        start = time.perf_counter()
+        cached = self._cache.get(name)
+        if cached is not None and cached[0] == key:
+            value = cached[1]
+            self.cache_hits.add(name)
+            self._trace.record(f"{name} (cached)", 0.0)
+        else:
+            with self._trace.stage(name):
+                value = compute()
+            self._cache[name] = (key, value)
+        self.timings[name] = time.perf_counter() - start
+        return value
+
+    def counts(self, batch, today, stretch_pct=0, shift=0, horizon_past=30,
+               horizon_future=90, collapse_overdues=False,
+               max_cards_per_day=-1, day_capacity=None, max_displacement=None,
+               fit_horizon=False, spread=None):
+        """
+        Run stages 1–6.  Returns (key, queue, int_counts) where *queue*
+        holds the review card indices in (original_due, cid) order and
+        *key* identifies the resulting day counts.  `window` is set to the
+        (horizon_past, horizon_future) actually used.
+
+        *spread* is how many days from today positive stretch and the
+        automatic cap even the reviews out over (default horizon_future);
+        fit_horizon sets it, see fit_horizon_to().
+        """
+        self.timings = {}
+        self.cache_hits = set()
+
+        # ---- 0. Fit the window to the cards --------------------------------
+        if fit_horizon:
+            key = (batch.token, today, horizon_past, horizon_future)
+            horizon_past, horizon_future, spread = self._stage(
+                "span", (key, spread), lambda: fit_horizon_to(
+                    batch, today, horizon_past, horizon_future, spread))
+        if spread is None:
+            spread = horizon_future
+        self.window = (horizon_past, horizon_future)
+        total_range = horizon_past + horizon_future
+        pivot_idx = horizon_past
+
+        # ---- 1. Build histogram --------------------------------------------
+        key = (batch.token, today, horizon_past, horizon_future)
+        queue, hist = self._stage("histogram", key, lambda: _stage_histogram(
+            batch, today - horizon_past, total_range))
+        total_cards = len(queue)
+        self.card_count = total_cards
+        self.base_hist = hist
+        if not total_cards:
+            return key, queue, hist
+
+        # ---- 2. Handle overdues ---------------------------------------------
+        sweep = collapse_overdues or stretch_pct > 0
+        key = (key, sweep)
+        hist, overdue_mass = self._stage("overdue", key, lambda: _stage_overdue(
+            hist, pivot_idx, sweep))
+
+        # ---- 3. Stretch ----------------------------------------------------
+        key = (key, stretch_pct, spread)
+        int_counts = self._stage("stretch", key, lambda: _stage_stretch(
+            hist, overdue_mass, stretch_pct, pivot_idx, total_cards, spread))
+
+        # ---- 4. Shift ------------------------------------------------------
+        key = (key, int(shift))
+        int_counts = self._stage("shift", key, lambda: _stage_shift(
+            int_counts, int(shift)))
+
+        # ---- 5. Post-shift collapse (if checkbox and negative shift leaked) -
+        key = (key, collapse_overdues)
+        int_counts = self._stage("collapse", key, lambda: _stage_collapse(
+            int_counts, pivot_idx, collapse_overdues))
+
+        # ---- 6. Level under the cap ---------------------------------------
+        if day_capacity is not None:
+            day_capacity = tuple(day_capacity)
+        key = (key, max_cards_per_day, day_capacity, max_displacement)
+        int_counts = self._stage("cap", key, lambda: _stage_cap(
+            int_counts, max_cards_per_day, total_cards, spread,
+            pivot_idx, day_capacity, max_displacement))
+
+        return key, queue, int_counts
+
+    def timeline(self, batch, today, **params):
+        """
+        (first_day, per-day counts) of the timeline run() would produce,
+        without assigning slots or touching *batch* – what a chart needs.
+        *params* are the keyword arguments of counts().
+        """
+        with self._lock:
+            _, queue, int_counts = self.counts(batch, today, **params)
+            horizon_past = self.window[0]
+        counts = _placed_counts(int_counts, len(queue), horizon_past)
+        horizon = len(int_counts)
+        return today - horizon_past, counts[:horizon] + [0] * (horizon - len(counts))
+
+    def run(self, batch, today, trace=NULL_RUN, **params):
+        """
+        Run the whole pipeline and write the result into *batch*.
+        *params* are the keyword arguments of counts().
+        """
+        with self._lock:
+            self._trace = trace
+            try:
+                return self._run(batch, today, params)
+            finally:
+                self._trace = NULL_RUN
+
+    def _run(self, batch, today, params):
+        key, queue, int_counts = self.counts(batch, today, **params)
+        horizon_past = self.window[0]
+
+        _reset_timeline(batch)
+        batch.first_day = today - horizon_past
+        if not len(queue):
+            batch.horizon = len(int_counts)
+            return batch
+
+        # ---- 7. Assign cards to slots --------------------------------------
+        start = time.perf_counter()
+        slots = self._stage("assign", key, lambda: _assign_slots(
+            int_counts, len(queue), horizon_past))
+        batch.horizon = len(int_counts)
+        with self._trace.stage("write slots"):
+            _write_slots(batch, queue, slots, today - horizon_past)
+        self.timings["assign"] = time.perf_counter() - start
+        return batch
+
+
+def _stage_histogram(batch, first_day, size):
+    review_idx, hist = _window_histogram(batch, first_day, size)
+    return _sort_by_original_due(batch, review_idx, first_day, size), hist
+
+
+def _stage_overdue(hist, pivot_idx, sweep):
     #   For positive stretch: remove overdues from histogram, add their
     #   mass to the uniform pool (they get spread evenly, not piled at t0).
     #   For collapse checkbox without stretch: same.
-    overdue_mass = 0
-    if collapse_overdues or stretch_pct > 0:
-        overdue_mass = sum(hist[:pivot_idx])
-        for i in range(pivot_idx):
-            hist[i] = 0
+    if not sweep:
+        return hist, 0
+    overdue_mass = sum(hist[:pivot_idx])
+    return [0] * pivot_idx + hist[pivot_idx:], overdue_mass
 
-    # ---- 3. Stretch --------------------------------------------------------
+
+def _stage_stretch(hist, overdue_mass, stretch_pct, pivot_idx, total_cards,
+                   spread=None):
     if stretch_pct > 0:
         # SHAPE-PRESERVING BLEND:
         #   result[i] = original[i] × (1-t) + uniform × t
         #
         #   Overdues are NOT piled at t0 — they only contribute
-        #   through the uniform component, spread across all future bins.
+        #   through the uniform component, spread across the first
+        #   *spread* future bins; bins past those keep their cards.
 
         t = stretch_pct / (stretch_pct + 100.0)
 
-        future_bins = len(hist) - pivot_idx
+        end = len(hist) if spread is None else min(len(hist), pivot_idx + spread)
+        future_bins = end - pivot_idx
         # Uniform includes both future cards AND swept overdues
-        future_total = sum(hist[pivot_idx:]) + overdue_mass
+        future_total = sum(hist[pivot_idx:end]) + overdue_mass
         uniform = future_total / max(1, future_bins)
 
-        blended = [0.0] * len(hist)
-        for i in range(pivot_idx, len(hist)):
+        blended = [0.0] * pivot_idx + [float(v) for v in hist[pivot_idx:]]
+        for i in range(pivot_idx, end):
             blended[i] = hist[i] * (1 - t) + uniform * t
 
-        int_counts = _stochastic_round(blended, total=total_cards, seed=42)
+        return _stochastic_round(blended, total=total_cards, seed=42)
 
-    elif stretch_pct < 0:
+    if stretch_pct < 0:
         # COMPRESS: geometric warp toward t0
+        stretch_factor = 1 + (stretch_pct / 100.0)
         stretched = _stretch_histogram(hist, stretch_factor, pivot_idx)
-        int_counts = _stochastic_round(stretched, total=total_cards, seed=42)
+        return _stochastic_round(stretched, total=total_cards, seed=42)
+
+    # No stretch: raw histogram. If collapse was active, pile at t0.
+    int_counts = list(hist)
+    if overdue_mass > 0:
+        int_counts[pivot_idx] += overdue_mass
+    return int_counts
 
-    else:
-        # No stretch: raw histogram. If collapse was active, pile at t0.
-        if overdue_mass > 0:
-            hist[pivot_idx] += overdue_mass
-        int_counts = list(hist)
 
-    # ---- 4. Shift ----------------------------------------------------------
+def _stage_shift(int_counts, shift):
     n = len(int_counts)
-    if shift:
-        shifted = [0] * n
-        for i, v in enumerate(int_counts):
-            j = i + int(shift)
-            if 0 <= j < n:
-                shifted[j] += v
-        int_counts = shifted
-
-    # ---- 5. Post-shift collapse (if checkbox and negative shift leaked) -----
-    if collapse_overdues and pivot_idx < len(int_counts):
-        swept = sum(int_counts[:pivot_idx])
-        if swept > 0:
-            for i in range(pivot_idx):
-                int_counts[i] = 0
-            int_counts[pivot_idx] += swept
-
-    # ---- 6. Manual cap override --------------------------------------------
-    if max_cards_per_day == 0:
-        auto_cap = max(1, -(-total_cards // max(1, horizon_future)))
-        int_counts = _cap_forward_autoextend(int_counts, auto_cap)
+    if not shift:
+        return int_counts
+    shifted = [0] * n
+    for i, v in enumerate(int_counts):
+        j = i + shift
+        if 0 <= j < n:
+            shifted[j] += v
+    return shifted
+
+
+def _stage_collapse(int_counts, pivot_idx, collapse_overdues):
+    if not collapse_overdues or pivot_idx >= len(int_counts):
+        return int_counts
+    swept = sum(int_counts[:pivot_idx])
+    if swept <= 0:
+        return int_counts
+    out = [0] * pivot_idx + int_counts[pivot_idx:]
+    out[pivot_idx] += swept
+    return out
+
+
+def _stage_cap(int_counts, max_cards_per_day, total_cards, spread,
+               pivot_idx, day_capacity=None, max_displacement=None):
+    if day_capacity:
+        # day_capacity starts today; rotate it onto the histogram bins
+        period = len(day_capacity)
+        capacity = [day_capacity[(i - pivot_idx) % period]
+                    for i in range(period)]
+    elif max_cards_per_day == 0:
+        capacity = max(1, -(-total_cards // max(1, spread)))
     elif max_cards_per_day > 0:
-        int_counts = _cap_forward_autoextend(int_counts, max_cards_per_day)
+        capacity = max_cards_per_day
+    else:
+        return int_counts
+    return _level_capacity(int_counts, capacity, pivot_idx, max_displacement)
 
-    final_range = len(int_counts)
 
-    # ---- 7. Assign cards to slots ------------------------------------------
-    slots = []
-    for day_idx, count in enumerate(int_counts):
-        slots.extend([day_idx] * count)
+def _assign_slots(int_counts, n_cards, pivot_idx):
+    """
+    Slot of each of the *n_cards* queued cards, in queue order.
 
-    queue = sorted(review_cards, key=lambda c: (c["original_due"], c["cid"]))
+    The day counts are expanded run by run (np.repeat, or array
+    repetition without NumPy), never card by card.  Cards beyond the
+    total capacity get one extra day each after the last used slot,
+    starting at *pivot_idx* when no slot was used at all.
+    """
+    if np is not None:
+        counts = np.asarray(int_counts, dtype=np.int64)
+        # only the days up to the one that covers n_cards are expanded
+        used = min(len(counts), int(np.searchsorted(np.cumsum(counts), n_cards)) + 1)
+        slots = np.repeat(np.arange(used), counts[:used])[:n_cards]
+        missing = n_cards - len(slots)
+        if missing > 0:
+            last = int(slots[-1]) if len(slots) else pivot_idx - 1
+            slots = np.concatenate(
+                (slots, np.arange(last + 1, last + 1 + missing, dtype=np.int64)))
+        return slots
+
+    slots = array("q")
+    for day_idx, day_count in enumerate(int_counts):
+        if len(slots) >= n_cards:
+            break
+        if day_count > 0:
+            slots.extend(array("q", [day_idx]) * day_count)
+    del slots[n_cards:]
+
+    missing = n_cards - len(slots)
+    if missing > 0:
+        last = slots[-1] if slots else pivot_idx - 1
+        slots.extend(range(last + 1, last + 1 + missing))
+    return slots
+
+
+def _placed_counts(int_counts, n_cards, pivot_idx):
+    """
+    Day counts as _assign_slots() fills them: *int_counts*, plus one
+    extra day per card that found no room (see there).
+    """
+    counts = [int(v) for v in int_counts]
+    placed = sum(counts)
+    if placed < n_cards:
+        last = max((day for day, v in enumerate(counts) if v), default=pivot_idx - 1)
+        counts = counts[:last + 1] + [1] * (n_cards - placed)
+    return counts
 
-    while len(slots) < len(queue):
-        slots.append(slots[-1] + 1 if slots else pivot_idx)
-    slots = slots[:len(queue)]
 
-    for card in card_data:
-        card["review_timeline"] = [False] * final_range
+# ===== Batch kernels ========================================================
+
+def _reset_timeline(batch):
+    """Restore the loaded due dates and clear all slots."""
+    if np is not None:
+        batch.due[:] = batch.original_due
+        batch.slot[:] = NO_SLOT
+    else:
+        batch.due = array("q", batch.original_due)
+        batch.slot = _filled_array("q", NO_SLOT, len(batch))
 
-    for card, slot in zip(queue, slots):
-        if 0 <= slot < final_range:
-            card["review_timeline"][slot] = True
-        card["due"] = today + (slot - horizon_past)
 
-    # ---- diagnostic --------------------------------------------------------
-    assigned = sum(1 for c in review_cards
-                   if any(c["review_timeline"]))
-    print(f"[TimeWarp] stretch={stretch_factor:.2f}x  shift={shift:+d}  "
-          f"cap={max_cards_per_day}  horizon={final_range}  "
-          f"in={total_cards}  out={assigned}")
+def _window_histogram(batch, first_day, size):
+    """
+    Indices of review cards whose original due falls in
+    [first_day, first_day + size), plus the per-day histogram of them.
+    """
+    if np is not None:
+        idx = batch.original_due - first_day
+        review_idx = np.nonzero((batch.type == CARD_TYPE_REVIEW)
+                                & (idx >= 0) & (idx < size))[0]
+        hist = np.bincount(idx[review_idx], minlength=size).tolist()
+        return review_idx, hist
+
+    review_idx = []
+    hist = [0] * size
+    for i, (due, ctype) in enumerate(zip(batch.original_due, batch.type)):
+        if ctype != CARD_TYPE_REVIEW:
+            continue
+        idx = due - first_day
+        if 0 <= idx < size:
+            hist[idx] += 1
+            review_idx.append(i)
+    return review_idx, hist
 
-    return card_data
+
+def _sort_by_original_due(batch, indices, first_day, size):
+    """
+    *indices* ordered by (original_due, cid).
+
+    All original dues lie in [first_day, first_day + size), so this is a
+    stable bucket sort by day over indices already in cid order (the
+    loader returns cards by id; anything else is cid-sorted first).
+    With NumPy the day offsets are narrowed to int16 where they fit,
+    which lets the stable argsort use radix sort.
+    """
+    cid = batch.cid
+    if np is not None:
+        ids = cid[indices]
+        if len(ids) > 1 and not np.all(ids[1:] >= ids[:-1]):
+            indices = indices[np.argsort(ids, kind="stable")]
+        offsets = batch.original_due[indices] - first_day
+        offsets = offsets.astype(np.int16 if size <= 32767 else np.int32)
+        return indices[np.argsort(offsets, kind="stable")]
+
+    if any(cid[a] > cid[b] for a, b in zip(indices, indices[1:])):
+        indices = sorted(indices, key=cid.__getitem__)
+    due = batch.original_due
+    buckets = [[] for _ in range(size)]
+    for i in indices:
+        buckets[due[i] - first_day].append(i)
+    return [i for bucket in buckets for i in bucket]
+
+
+def _write_slots(batch, queue, slots, first_day):
+    """
+    Give card queue[k] the slot slots[k] and the matching due date.
+    Slots outside the batch horizon keep their due but stay NO_SLOT.
+    """
+    horizon = batch.horizon
+    if np is not None:
+        slots = np.asarray(slots, dtype="int64")
+        batch.due[queue] = first_day + slots
+        batch.slot[queue] = np.where((slots >= 0) & (slots < horizon),
+                                     slots, NO_SLOT)
+        return
+    for i, slot in zip(queue, slots):
+        batch.due[i] = first_day + slot
+        if 0 <= slot < horizon:
+            batch.slot[i] = slot
 
 
 # ===== Stretch ==============================================================
@@ -222,7 +959,14 @@ def _stretch_histogram(counts, stretch_factor, pivot_idx):
       - s <= 0: collapse everything onto pivot.
 
     Uses forward overlap mapping.  Mass is exactly conserved.
+    Runs the vectorized kernel when NumPy is available.
     """
+    if np is not None:
+        return _stretch_histogram_np(counts, stretch_factor, pivot_idx)
+    return _stretch_histogram_py(counts, stretch_factor, pivot_idx)
+
+
+def _stretch_histogram_py(counts, stretch_factor, pivot_idx):
     n = len(counts)
     if n == 0:
         return []
@@ -288,6 +1032,53 @@ def _stretch_histogram(counts, stretch_factor, pivot_idx):
     return out
 
 
+def _stretch_histogram_np(counts, stretch_factor, pivot_idx):
+    """
+    Closed-form _stretch_histogram_py().
+
+    Warped bins are laid end to end, so the stretched mass has a
+    piecewise-linear cumulative distribution with knots at the warped
+    bin edges.  Each output bin receives the difference of that CDF
+    between its own edges, which np.interp evaluates for all bins at once.
+    """
+    n = len(counts)
+    if n == 0:
+        return []
+    s = stretch_factor
+    if abs(s - 1.0) < 1e-12:
+        return [float(x) for x in counts]
+
+    if s <= 0:
+        out = [0.0] * n
+        out[pivot_idx] = float(sum(counts))
+        return out
+
+    mass = np.clip(np.asarray(counts, dtype=float), 0.0, None)
+    out_n = n
+    first = 0
+    if s > 1.0:
+        occupied = np.nonzero(mass)[0]
+        rightmost = int(occupied[-1]) if len(occupied) else n - 1
+        max_hi = pivot_idx + s * (rightmost + 0.5 - pivot_idx)
+        out_n = max(n, int(math.ceil(max_hi + 0.5)) + 1)
+        # past bins pass through unchanged
+        first = pivot_idx
+
+    out = np.zeros(out_n)
+    out[:first] = mass[:first]
+
+    pivot = float(pivot_idx)
+    knots = pivot + s * (np.arange(first, n + 1) - 0.5 - pivot)
+    if s > 1.0:
+        # pivot bin doesn't leak left
+        knots[0] = max(knots[0], pivot)
+    cdf = np.concatenate(([0.0], np.cumsum(mass[first:])))
+    edges = np.arange(out_n + 1) - 0.5
+    out += np.diff(np.interp(edges, knots, cdf))
+
+    return out.tolist()
+
+
 # ===== Shift ================================================================
 
 def _shift_array(arr, shift_days):
@@ -306,6 +1097,11 @@ def _shift_array(arr, shift_days):
 
 # ===== Rounding =============================================================
 
+# Resolution of _stochastic_round(): fractional parts closer than one
+# part in ROUNDING_UNITS count as tied.
+ROUNDING_UNITS = 10 ** 9
+
+
 def _stochastic_round(dense, total, seed=42):
     """
     Deterministic stochastic rounding that exactly preserves *total*.
@@ -313,55 +1109,431 @@ def _stochastic_round(dense, total, seed=42):
     Floor everything, then hand out the remaining units to the bins
     with the largest fractional parts (largest-remainder method with
     tie-breaking by seeded random to avoid systematic bias).
+
+    Only the *need* winning bins are selected, not a full ordering.  The
+    values are first quantized to ROUNDING_UNITS per card with the same
+    float operations on both paths, so the two stretch kernels' last-bit
+    differences cannot decide a tie; the NumPy and the pure-Python path
+    then draw the same tie-breakers and return identical results.
     """
     rng = random.Random(seed)
+    if np is not None:
+        return _stochastic_round_np(dense, total, rng)
+    return _stochastic_round_py(dense, total, rng)
 
-    floors = [int(math.floor(x)) for x in dense]
-    fracs = [x - f for x, f in zip(dense, floors)]
+
+def _stochastic_round_py(dense, total, rng):
+    units = [int(math.floor(x * ROUNDING_UNITS + 0.5)) for x in dense]
+    floors = [u // ROUNDING_UNITS for u in units]
+    fracs = [u % ROUNDING_UNITS for u in units]
     need = total - sum(floors)
 
     if need <= 0:
         return floors
 
-    # Indices sorted by fractional part desc, ties broken randomly
-    order = sorted(range(len(dense)),
-                   key=lambda i: (-fracs[i], rng.random()))
-    for i in order[:need]:
+    # Largest fractional parts first, ties broken randomly
+    ties = [rng.random() for _ in range(len(dense))]
+    for i in heapq.nsmallest(need, range(len(dense)),
+                             key=lambda i: (-fracs[i], ties[i])):
         floors[i] += 1
 
     return floors
 
 
-# ===== Cap enforcement ======================================================
+def _stochastic_round_np(dense, total, rng):
+    values = np.asarray(dense, dtype=float)
+    units = np.floor(values * ROUNDING_UNITS + 0.5).astype(np.int64)
+    floors = units // ROUNDING_UNITS
+    fracs = units % ROUNDING_UNITS
+    need = total - int(floors.sum())
+
+    if need <= 0:
+        return floors.tolist()
+
+    ties = np.array([rng.random() for _ in range(len(values))])
+    if need >= len(values):
+        floors += 1
+        return floors.tolist()
+
+    # Partial selection: everything strictly above the need-th largest
+    # fraction wins; the remaining units go to the bins tied with it
+    # that have the smallest tie-breakers.
+    threshold = np.partition(-fracs, need - 1)[need - 1]
+    winners = np.nonzero(-fracs < threshold)[0]
+    tied = np.nonzero(-fracs == threshold)[0]
+    rest = need - len(winners)
+    if rest < len(tied):
+        tied = tied[np.argpartition(ties[tied], rest - 1)[:rest]]
+    floors[winners] += 1
+    floors[tied] += 1
+
+    return floors.tolist()
+
 
-def _cap_forward_autoextend(counts, cap):
+# ===== Capacity leveling ====================================================
+
+def weekly_capacity(weekday_cap, weekend_cap, first_weekday):
+    """
+    Seven per-day caps for day_capacity, starting on *first_weekday*
+    (0 = Monday); Saturday and Sunday get *weekend_cap*.
     """
-    Enforce per-day cap; overflow spills forward.
-    Auto-extends the array if the last bin overflows.
+    return [weekend_cap if (first_weekday + i) % 7 >= 5 else weekday_cap
+            for i in range(7)]
+
+
+def _level_capacity(counts, capacity, pivot_idx=0, max_displacement=None):
+    """
+    Water-fill *counts* under a per-day *capacity*.
+
+    *capacity* is one cap for every day or a sequence of per-day caps
+    that repeats cyclically (e.g. lower values on weekend days).
+
+    Days are scanned once from left to right.  Under-loaded days at or
+    after *pivot_idx* (today) are remembered with their spare capacity;
+    when a day overflows, the excess is first pulled back into the
+    nearest of those earlier days – at most *max_displacement* days back,
+    if given – and only the remainder spills forward.  Overflow past the
+    last day extends the tail just far enough to hold it.  Every day
+    enters and leaves the spare queue once, so the pass is O(horizon).
     Total mass is strictly preserved.
     """
-    if cap <= 0:
-        return counts
+    if isinstance(capacity, int):
+        if capacity <= 0:
+            return counts
+        caps = None
+    else:
+        caps = list(capacity)
+        if not caps or max(caps) <= 0:
+            raise ValueError("day capacity needs at least one positive day")
+
+    def cap_at(day):
+        return capacity if caps is None else caps[day % len(caps)]
 
     out = []
+    spare = deque()     # [day, free capacity], latest day on the right
     carry = 0
-    for v in counts:
+    for day, v in enumerate(counts):
+        cap = cap_at(day)
         v += carry
-        out.append(min(v, cap))
-        carry = max(0, v - cap)
+        carry = 0
+        if max_displacement is not None:
+            while spare and spare[0][0] < day - max_displacement:
+                spare.popleft()
+        excess = v - cap
+        if excess > 0:
+            v = cap
+            while excess and spare:
+                earlier = spare[-1]
+                take = min(earlier[1], excess)
+                out[earlier[0]] += take
+                excess -= take
+                earlier[1] -= take
+                if not earlier[1]:
+                    spare.pop()
+            carry = excess
+        out.append(v)
+        if day >= pivot_idx and v < cap:
+            spare.append([day, cap - v])
+
+    if caps is None:
+        full, rest = divmod(carry, capacity)
+        out.extend([capacity] * full)
+        if rest:
+            out.append(rest)
+    else:
+        while carry > 0:
+            take = min(carry, cap_at(len(out)))
+            out.append(take)
+            carry -= take
+
+    return out
+
+
+# ===== Deck groups ==========================================================
+
+# simulate_review_timeline() keywords that simulate_groups() sets for all
+# groups at once; they are ignored in a group's own params.
+SHARED_GROUP_PARAMS = ("horizon_past", "horizon_future", "fit_horizon", "spread")
 
-    while carry > 0:
-        take = min(carry, cap)
-        out.append(take)
-        carry -= take
 
+def simulate_groups(groups, daily_budget=-1, horizon_past=30,
+                    horizon_future=90, fit_horizon=False):
+    """
+    Simulate several decks or tag groups, each with its own settings,
+    under one shared daily budget.
+
+    *groups* is a list of (batch, params) pairs: a CardBatch per group
+    (e.g. from snapshot_cache.get(deck, tags)) and the
+    simulate_review_timeline() keywords for it – stretch_pct, shift,
+    collapse_overdues, max_cards_per_day, day_capacity and
+    max_displacement.  The horizons are common to all groups so their
+    timelines line up slot for slot; with *fit_horizon* they are
+    widened to cover the cards of every group.  SHARED_GROUP_PARAMS in
+    a group's params are ignored for the same reason.  Groups must not
+    share cards (see overlapping_decks()); ValueError is raised if they
+    do.
+
+    Stages 1–6 run per group, each on its own histogram, one group
+    after the other: the stages hold the GIL, so threads gained
+    nothing.  The day counts are then reconciled against *daily_budget*
+    (reviews per day over all groups: one number, or per-day values
+    starting today that repeat cyclically; -1 = none), see
+    _reconcile_budget(), and every group's cards are assigned to its
+    reconciled days.
+
+    The batches are updated in place and returned as a list.
+    """
+    cids = [batch.cid for batch, _ in groups]
+    if len(set().union(*map(set, cids))) < sum(map(len, cids)):
+        raise ValueError("Deck groups share cards; each card can only be in one group.")
+
+    today = _col().sched.today
+    spread = None
+    if fit_horizon:
+        for batch, _ in groups:
+            horizon_past, horizon_future, spread = fit_horizon_to(
+                batch, today, horizon_past, horizon_future, spread)
+
+    results = []
+    for batch, params in groups:
+        params = {key: value for key, value in params.items()
+                  if key not in SHARED_GROUP_PARAMS}
+        results.append(SimulationPipeline().counts(
+            batch, today, horizon_past=horizon_past,
+            horizon_future=horizon_future, spread=spread, **params))
+
+    counts = _reconcile_budget([int_counts for _, _, int_counts in results],
+                               daily_budget, horizon_past)
+    for (batch, _), (_, queue, _), int_counts in zip(groups, results, counts):
+        _reset_timeline(batch)
+        batch.first_day = today - horizon_past
+        batch.horizon = len(int_counts)
+        if len(queue):
+            slots = _assign_slots(int_counts, len(queue), horizon_past)
+            _write_slots(batch, queue, slots, today - horizon_past)
+    return [batch for batch, _ in groups]
+
+
+def overlapping_decks(decks):
+    """
+    The first pair of *decks* that would share cards as groups – the
+    same deck twice, a deck and one of its subdecks, or "All" and any
+    other – or None.
+    """
+    for i, first in enumerate(decks):
+        for second in decks[i + 1:]:
+            if _deck_contains(first, second) or _deck_contains(second, first):
+                return first, second
+    return None
+
+
+def _deck_contains(parent, deck):
+    parent, deck = parent.lower(), deck.lower()
+    return parent in ("", "all") or deck == parent or deck.startswith(parent + "::")
+
+
+def _reconcile_budget(group_counts, budget, pivot_idx=0):
+    """
+    Fit per-group day counts under a shared per-day *budget*.
+
+    Days from *pivot_idx* (today) on are scanned once.  A group's demand
+    on a day is its own count plus whatever it carried in; if the demands
+    fit the budget they are kept, otherwise the budget is split in
+    proportion to them (_largest_remainder) and each group carries the
+    rest to the next day, so every group keeps its share of a busy day
+    and nothing is lost.  Days before the pivot are left alone.
+
+    Returns equally long lists, one per group, extended as far as the
+    carried cards need.
+    """
+    counts = [[int(v) for v in c] for c in group_counts]
+    length = max(map(len, counts), default=0)
+    counts = [c + [0] * (length - len(c)) for c in counts]
+    if isinstance(budget, int):
+        if budget <= 0:
+            return counts
+        caps = None
+    else:
+        caps = list(budget)
+        if not caps or max(caps) <= 0:
+            raise ValueError("daily budget needs at least one positive day")
+
+    def cap_at(day):
+        return budget if caps is None else caps[(day - pivot_idx) % len(caps)]
+
+    out = [c[:pivot_idx] for c in counts]
+    carry = [0] * len(counts)
+    day = pivot_idx
+    while day < length or any(carry):
+        demand = [carried + (c[day] if day < length else 0)
+                  for carried, c in zip(carry, counts)]
+        cap = cap_at(day)
+        if sum(demand) > cap:
+            take = _largest_remainder(demand, cap)
+        else:
+            take = demand
+        for g, taken in enumerate(take):
+            out[g].append(taken)
+            carry[g] = demand[g] - taken
+        day += 1
     return out
 
 
-# ===== Legacy helpers (used by ui.py) =======================================
+def _largest_remainder(weights, total):
+    """
+    Split *total* units in proportion to the integer *weights*: every
+    share is rounded down, and the units left over go to the largest
+    remainders, earlier groups first on ties.  Exact integer arithmetic.
+    """
+    weight_sum = sum(weights)
+    if total <= 0 or not weight_sum:
+        return [0] * len(weights)
+    shares = [total * w // weight_sum for w in weights]
+    left = total - sum(shares)
+    if left:
+        by_remainder = sorted(range(len(weights)),
+                              key=lambda g: -(total * weights[g] % weight_sum))
+        for g in by_remainder[:left]:
+            shares[g] += 1
+    return shares
+
+
+# ===== Parameter sweep ======================================================
+
+SWEEP_METRICS = ("peak", "p95", "tail", "mean_displacement")
+
+
+def sweep_parameters(batch, stretches=(0,), shifts=(0,), caps=(-1,),
+                     horizon_past=30, horizon_future=90, fit_horizon=False,
+                     collapse_overdues=False, max_displacement=None,
+                     should_stop=None, day_capacity=None):
+    """
+    Evaluate every (stretch_pct, shift, max_cards_per_day) combination of
+    the three grids on *batch*, which is left untouched.
+
+    The grid is walked stretch-major through one SimulationPipeline, so
+    the base histogram is built once, every stretch is rounded once and
+    every (stretch, shift) pair is shifted once; only the leveling runs
+    per combination.  No card is assigned a slot – the metrics are read
+    off the day counts:
+
+      peak              – busiest day from today on; cards still overdue
+                          count as due today
+      p95               – 95th percentile of the daily load from today to
+                          the last day with reviews
+      tail              – number of days from today to that last day
+      mean_displacement – mean |new due − old due| of the review cards
+
+    *day_capacity* (per-day caps, see simulate_review_timeline()) replaces
+    the flat cap of the combinations with a manual cap (> 0), as the
+    dialog does when a weekend cap is set.
+
+    Returns one dict per combination (the three parameters plus the
+    metrics), stretch-major.  *should_stop*, if given, is polled between
+    combinations; returning True ends the sweep early with None.
+    """
+    today = _col().sched.today
+    pipeline = SimulationPipeline()
+    results = []
+    for stretch_pct in stretches:
+        for shift in shifts:
+            for cap in caps:
+                if should_stop is not None and should_stop():
+                    return None
+                _, queue, int_counts = pipeline.counts(
+                    batch, today, stretch_pct=stretch_pct, shift=shift,
+                    horizon_past=horizon_past, horizon_future=horizon_future,
+                    fit_horizon=fit_horizon,
+                    collapse_overdues=collapse_overdues,
+                    max_cards_per_day=cap, max_displacement=max_displacement,
+                    day_capacity=day_capacity if cap > 0 else None)
+                metrics = _sweep_metrics(pipeline.base_hist, int_counts,
+                                         len(queue), pipeline.window[0])
+                metrics.update(stretch_pct=stretch_pct, shift=shift,
+                               max_cards_per_day=cap)
+                results.append(metrics)
+    return results
+
+
+def _sweep_metrics(base_hist, int_counts, n_cards, pivot_idx):
+    """
+    SWEEP_METRICS of one simulated timeline, from run-length histograms.
+
+    Cards are assigned to days in original-due order (_assign_slots), so
+    each card's displacement follows from the two cumulative histograms:
+    the total is the sum over days of |cards due by day d before − after|.
+    """
+    counts = _placed_counts(int_counts, n_cards, pivot_idx)
+    load = counts[pivot_idx:] or [0]
+    load[0] += sum(counts[:pivot_idx])
+    tail = len(load)
+    while tail and not load[tail - 1]:
+        tail -= 1
+    busy = sorted(load[:tail]) or [0]
+    p95 = busy[max(0, -(-len(busy) * 95 // 100) - 1)]
+
+    size = max(len(base_hist), len(counts))
+    if np is not None:
+        before = np.zeros(size, dtype=np.int64)
+        before[:len(base_hist)] = base_hist
+        after = np.zeros(size, dtype=np.int64)
+        after[:len(counts)] = counts
+        moved = int(np.abs(np.cumsum(before) - np.cumsum(after)).sum())
+    else:
+        moved = 0
+        before = after = 0
+        for day in range(size):
+            before += base_hist[day] if day < len(base_hist) else 0
+            after += counts[day] if day < len(counts) else 0
+            moved += abs(before - after)
+
+    return {
+        "peak": max(load),
+        "p95": p95,
+        "tail": tail,
+        "mean_displacement": moved / n_cards if n_cards else 0.0,
+    }
+
+
+# ===== Timeline helpers ====================================================
+
+def timeline_histogram(card_data, horizon=None):
+    """
+    Per-day card counts of a simulated timeline, built in O(N) from slots.
+
+    *horizon* defaults to the batch horizon, or for card dicts to one
+    past the highest occupied slot.
+    """
+    if isinstance(card_data, CardBatch):
+        return card_data.histogram(horizon)
+    slots = [card["slot"] for card in card_data if card.get("slot", NO_SLOT) != NO_SLOT]
+    if horizon is None:
+        horizon = max(slots) + 1 if slots else 0
+    counts = [0] * horizon
+    for slot in slots:
+        if slot < horizon:
+            counts[slot] += 1
+    return counts
+
+
+def timeline_row(card, horizon):
+    """Materialize the legacy boolean review_timeline row of one card."""
+    row = [False] * horizon
+    slot = card.get("slot", NO_SLOT)
+    if 0 <= slot < horizon:
+        row[slot] = True
+    return row
+
+
+# ===== Legacy helpers =======================================================
 
 def compute_due_matrix(card_data, horizon):
-    return [card["review_timeline"] for card in card_data]
+    """Dense cards × horizon matrix; only for callers that need rows."""
+    if isinstance(card_data, CardBatch):
+        card_data = card_data.to_dicts()
+    if not horizon:
+        horizon = len(timeline_histogram(card_data))
+    return [timeline_row(card, horizon) for card in card_data]
 
 def sum_matrix_columns(matrix):
     if not matrix:
@@ -379,56 +1551,250 @@ def count_remaining_new_cards(deck_name, tags=None):
     if tags:
         tag_query = " OR ".join([f'tag:"{t}"' for t in tags])
         query += f" AND ({tag_query})"
-    return mw.col.count_matching_cards(query)
+    return _col().count_matching_cards(query)
 
 
 # ===== Apply to Anki DB ====================================================
 
-def apply_transformed_due_dates(card_data, horizon_past=30):
-    today = mw.col.sched.today
-    undo_entry = mw.col.add_custom_undo_entry("Time Warp")
-    for card_info in card_data:
-        card = mw.col.get_card(card_info["cid"])
-        timeline = card_info.get("review_timeline", [])
-        if not timeline or card_info["type"] != "review":
-            continue
-        try:
-            index = timeline.index(True)
-            new_due = today + (index - horizon_past)
-            card.due = new_due
-            mw.col.update_card(card)
-            mw.col.merge_undo_entries(undo_entry)
-        except ValueError:
-            continue
-    mw.col.save()
+# Cards written per update_cards() call when applying.
+APPLY_CHUNK = 2000
+
+
+class ApplyCancelled(Exception):
+    """A write_due_dates() call was cancelled and has been rolled back."""
+
+
+def write_due_dates(cids, dues, progress=None, chunk_size=APPLY_CHUNK,
+                    undo_name="Time Warp", should_cancel=None, return_changes=False):
+    """
+    Set card *cids* to the matching *dues* as a single undo step.  Cards
+    in a filtered deck get the due of their home deck (odue) instead.
+
+    Cards are written in chunks through the batched update_cards() call
+    and every chunk is merged into one custom undo entry, followed by a
+    single save.  *progress*, if given, is called as progress(done, total)
+    after each chunk.  Returns the number of cards written.
+
+    *should_cancel*, if given, is polled after every chunk but the last.
+    Once it returns True the cards written so far get their old dues
+    back, merged into the same undo entry, and ApplyCancelled is raised.
+    The cards are as they were before the call, and there is no undo or
+    redo step that would bring the partial write back.
+
+    With *return_changes* the result is (count, changes), changes being
+    the OpChanges of the merged undo entry (None if nothing was written),
+    for returning from a CollectionOp.
+    """
+    total = len(cids)
+    if not total:
+        return (0, None) if return_changes else 0
+    col = _col()
+    changes = None
+    replaced = []  # dues the chunks so far overwrote, for a rollback
+    undo_entry = col.add_custom_undo_entry(undo_name)
+    for start in range(0, total, chunk_size):
+        end = min(total, start + chunk_size)
+        replaced.extend(_set_dues(col, cids[start:end], dues[start:end]))
+        changes = col.merge_undo_entries(undo_entry)
+        if progress:
+            progress(end, total)
+        if should_cancel is not None and end < total and should_cancel():
+            for back in range(0, end, chunk_size):
+                stop = min(end, back + chunk_size)
+                _set_dues(col, cids[back:stop], replaced[back:stop])
+            col.merge_undo_entries(undo_entry)
+            raise ApplyCancelled(f"{undo_name} cancelled after {end} of {total} cards"
+                                 " and rolled back")
+    col.save()
+    return (total, changes) if return_changes else total
+
+
+def _set_dues(col, cids, dues):
+    """Write one chunk of *dues* with update_cards(); returns the dues replaced."""
+    cards = []
+    replaced = []
+    for cid, due in zip(cids, dues):
+        card = col.get_card(int(cid))
+        if card.odid:
+            replaced.append(card.odue)
+            card.odue = int(due)  # home deck due, restored on leaving
+        else:
+            replaced.append(card.due)
+            card.due = int(due)
+        cards.append(card)
+    col.update_cards(cards)
+    return replaced
+
+
+def apply_transformed_due_dates(card_data, horizon_past=None, progress=None,
+                                should_cancel=None):
+    """
+    Write the simulated due date of every placed card, see
+    write_due_dates() for *progress* and *should_cancel*.
+
+    Slots are counted from the batch's first_day, or from *horizon_past*
+    days before today if given (card dicts default to 30).
+    """
+    if not isinstance(card_data, CardBatch):
+        card_data = CardBatch.from_dicts(card_data)
+        if horizon_past is None:
+            horizon_past = 30
+    first_day = None
+    if horizon_past is not None:
+        first_day = _col().sched.today - horizon_past
+    cids, _, dues = due_date_diff(card_data, first_day)
+    return write_due_dates(cids, dues, progress=progress,
+                           should_cancel=should_cancel)
+
+
+# Day ranges of displacement_histogram(), inclusive; None = open end.
+DISPLACEMENT_BINS = ((None, -30), (-29, -8), (-7, -2), (-1, -1),
+                     (1, 1), (2, 7), (8, 29), (30, None))
+
+
+def due_date_diff(card_data, first_day=None):
+    """
+    The cards a warp actually moves: (cids, old_dues, new_dues) of the
+    placed review cards whose new due – slot counted from *first_day*,
+    by default the batch's own – differs from the loaded one.  Cards
+    that land on their old day are left out, so they are not rewritten
+    (and not uploaded on the next sync).
+    """
+    if not isinstance(card_data, CardBatch):
+        card_data = CardBatch.from_dicts(card_data)
+    if first_day is None:
+        first_day = card_data.first_day
+    placed = card_data.placed_indices()
+    if np is not None:
+        placed = np.asarray(placed, dtype=np.int64)
+        new_dues = first_day + card_data.slot[placed]
+        moved = new_dues != card_data.original_due[placed]
+        placed = placed[moved]
+        return (card_data.cid[placed], card_data.original_due[placed],
+                new_dues[moved])
+    cids, old_dues, new_dues = [], [], []
+    for i in placed:
+        old, new = card_data.original_due[i], first_day + card_data.slot[i]
+        if new != old:
+            cids.append(card_data.cid[i])
+            old_dues.append(old)
+            new_dues.append(new)
+    return cids, old_dues, new_dues
+
+
+def merge_diffs(diffs):
+    """One (cids, old_dues, new_dues) diff from several due_date_diff() results."""
+    cids, old_dues, new_dues = [], [], []
+    for diff_cids, diff_old, diff_new in diffs:
+        cids.extend(int(cid) for cid in diff_cids)
+        old_dues.extend(int(due) for due in diff_old)
+        new_dues.extend(int(due) for due in diff_new)
+    return cids, old_dues, new_dues
+
+
+def displacement_histogram(old_dues, new_dues, bins=DISPLACEMENT_BINS):
+    """Number of cards per (low, high) range of new − old due, in days."""
+    lows = [float("-inf") if low is None else low for low, _ in bins]
+    if np is not None:
+        deltas = (np.asarray(new_dues, dtype=np.int64)
+                  - np.asarray(old_dues, dtype=np.int64))
+        idx = np.searchsorted(np.asarray(lows), deltas, side="right") - 1
+        highs = np.asarray([np.inf if high is None else high for _, high in bins])
+        inside = (idx >= 0) & (deltas <= highs[np.maximum(idx, 0)])
+        return np.bincount(idx[inside], minlength=len(bins)).tolist()
+    counts = [0] * len(bins)
+    for old, new in zip(old_dues, new_dues):
+        delta = int(new) - int(old)
+        b = bisect.bisect_right(lows, delta) - 1
+        if b >= 0 and (bins[b][1] is None or delta <= bins[b][1]):
+            counts[b] += 1
+    return counts
 
 
 # ===== Optional utilities ===================================================
 
 def set_all_to_new(card_data):
+    if isinstance(card_data, CardBatch):
+        n = len(card_data)
+        card_data.type = _filled_array("b", CARD_TYPE_NEW, n)
+        card_data.due = _filled_array("q", 0, n)
+        card_data.touch()
+        return
     for card in card_data:
         card["type"] = "new"
         card["due"] = 0
 
 def shuffle_new_cards(card_data):
+    if isinstance(card_data, CardBatch):
+        new_idx = [i for i, t in enumerate(card_data.type) if t == CARD_TYPE_NEW]
+        other_idx = [i for i, t in enumerate(card_data.type) if t != CARD_TYPE_NEW]
+        random.shuffle(new_idx)
+        card_data.reorder(new_idx + other_idx)
+        return
     new_cards = [card for card in card_data if card["type"] == "new"]
     other_cards = [card for card in card_data if card["type"] != "new"]
     random.shuffle(new_cards)
     card_data[:] = new_cards + other_cards
 
-def create_filtered_deck_from_transformed(card_data, deck_name="Simulated Timeline"):
-    deck = mw.col.decks.by_name(deck_name)
-    if not deck:
-        did = mw.col.decks.new_filtered(deck_name)
-    else:
-        did = deck["id"]
-    cids = [str(ci["cid"]) for ci in card_data if ci.get("review_timeline")]
+# Most cards placed into one filtered deck; larger sets are split.
+FILTERED_DECK_SIZE = 5000
+
+# anki.consts.DYN_DUE – order filtered deck cards by due date
+_DYN_DUE = 6
+
+
+def create_filtered_deck_from_transformed(card_data, deck_name="Simulated Timeline",
+                                          deck_size=FILTERED_DECK_SIZE):
+    """
+    Gather the placed cards of *card_data* into filtered decks.
+
+    Each deck selects its cards with one compact `cid:1,2,3` search and
+    holds at most *deck_size* of them; bigger sets are split over
+    "<deck_name>", "<deck_name> 2", …  All parts, including leftovers of
+    an earlier export, are emptied before any is rebuilt, so cards move
+    freely between the parts on a re-export.
+
+    Returns (deck ids, cards moved).  Cards that already sit in some
+    other filtered deck are not moved, so the count can be lower than
+    the number of placed cards.
+    """
+    if not isinstance(card_data, CardBatch):
+        card_data = CardBatch.from_dicts(card_data)
+    cids = [str(card_data.cid[i]) for i in card_data.placed_indices()]
     if not cids:
-        return
-    query = f"cid:{' OR cid:'.join(cids)}"
-    deck = mw.col.decks.get(did)
-    deck["terms"] = [[query, 1000, "due"]]
-    deck["reschedule"] = True
-    mw.col.decks.save(deck)
-    mw.col.decks.select(did)
-    mw.col.sched.rebuild_filtered_deck(did)
+        return [], 0
+
+    col = _col()
+    parts = [cids[start:start + deck_size]
+             for start in range(0, len(cids), deck_size)]
+    dids = []
+    for number in range(1, len(parts) + 1):
+        name = deck_name if number == 1 else f"{deck_name} {number}"
+        deck = col.decks.by_name(name)
+        if not deck:
+            did = col.decks.new_filtered(name)
+        elif deck["dyn"]:
+            did = deck["id"]
+            col.sched.empty_filtered_deck(did)
+        else:
+            raise ValueError(f'"{name}" exists and is not a filtered deck')
+        dids.append(did)
+
+    # parts left over from an earlier, bigger export would keep their cards
+    number = len(parts) + 1
+    while True:
+        stale = col.decks.by_name(f"{deck_name} {number}")
+        if not stale or not stale["dyn"]:
+            break
+        col.sched.empty_filtered_deck(stale["id"])
+        number += 1
+
+    moved = 0
+    for did, part in zip(dids, parts):
+        deck = col.decks.get(did)
+        deck["terms"] = [[f"cid:{','.join(part)}", len(part), _DYN_DUE]]
+        deck["resched"] = True
+        col.decks.save(deck)
+        moved += col.sched.rebuild_filtered_deck(did).count
+    col.decks.select(dids[0])
+    return dids, moved
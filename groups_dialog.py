@@ -0,0 +1,169 @@
+from aqt.operations import QueryOp
+from aqt.utils import showWarning, tooltip
+from PyQt6.QtCore import pyqtSignal
+from PyQt6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, QSpinBox, QPushButton,
+    QTableWidget, QHeaderView, QPlainTextEdit
+)
+
+from .core import snapshot_cache, simulate_groups, due_date_diff, overlapping_decks
+
+COLUMNS = ("Deck", "Stretch %", "Shift (days)", "Cap/day")
+
+
+def subdecks(deck_names, parent):
+    """Direct children of *parent* among *deck_names*."""
+    prefix = parent + "::"
+    return [name for name in deck_names
+            if name.startswith(prefix) and "::" not in name[len(prefix):]]
+
+
+class GroupsDialog(QDialog):
+    """
+    Per-deck settings under one shared daily budget (core.simulate_groups).
+
+    Every row warps one deck with its own stretch, shift and cap; the
+    remaining settings come from the main dialog.  Preview simulates all
+    rows and lists what each group does; Write emits
+    writeRequested(batches) with the simulated batches.
+    """
+
+    writeRequested = pyqtSignal(object)
+
+    def __init__(self, deck_names, decks, tags, defaults, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Time Warp – Deck groups")
+        self.resize(760, 520)
+        self.deck_names = list(deck_names)
+        self.tags = list(tags)
+        self.defaults = dict(defaults)
+        self.batches = None
+
+        self.table = QTableWidget(0, len(COLUMNS))
+        self.table.setHorizontalHeaderLabels(COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+
+        add_btn = QPushButton("Add Deck")
+        add_btn.clicked.connect(lambda: self.add_row(self.deck_names[0]))
+        remove_btn = QPushButton("Remove Deck")
+        remove_btn.clicked.connect(self.remove_row)
+        self.budget_spin = QSpinBox()
+        self.budget_spin.setRange(-1, 100000)
+        self.budget_spin.setValue(-1)
+        self.budget_spin.setToolTip("Reviews per day over all groups.\n-1 = no shared budget.")
+        self.budget_spin.valueChanged.connect(self.settings_changed)
+
+        rows = QHBoxLayout()
+        rows.addWidget(add_btn)
+        rows.addWidget(remove_btn)
+        rows.addStretch()
+        rows.addWidget(QLabel("Daily budget (all groups):"))
+        rows.addWidget(self.budget_spin)
+
+        self.preview_btn = QPushButton("Preview")
+        self.preview_btn.clicked.connect(self.preview)
+        self.write_btn = QPushButton("Write Changes…")
+        self.write_btn.setEnabled(False)
+        self.write_btn.clicked.connect(self.write)
+        self.summary = QPlainTextEdit()
+        self.summary.setReadOnly(True)
+        self.summary.setStyleSheet("font-family: monospace;")
+
+        buttons = QHBoxLayout()
+        buttons.addStretch()
+        buttons.addWidget(self.preview_btn)
+        buttons.addWidget(self.write_btn)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel("Each deck is warped with its own settings; together they "
+                                "stay under the daily budget. Decks must not overlap."))
+        layout.addWidget(self.table)
+        layout.addLayout(rows)
+        layout.addWidget(self.summary)
+        layout.addLayout(buttons)
+
+        for deck in decks:
+            self.add_row(deck)
+
+    def add_row(self, deck):
+        row = self.table.rowCount()
+        self.table.insertRow(row)
+        deck_select = QComboBox()
+        deck_select.addItems(self.deck_names)
+        deck_select.setCurrentText(deck)
+        self.table.setCellWidget(row, 0, deck_select)
+        for column, (low, high, key) in enumerate(
+                ((-100, 500, "stretch_pct"), (-30, 30, "shift"),
+                 (-1, 100000, "max_cards_per_day")), start=1):
+            spin = QSpinBox()
+            spin.setRange(low, high)
+            spin.setValue(self.defaults[key])
+            spin.valueChanged.connect(self.settings_changed)
+            self.table.setCellWidget(row, column, spin)
+        deck_select.currentIndexChanged.connect(self.settings_changed)
+        self.settings_changed()
+
+    def remove_row(self):
+        row = self.table.currentRow()
+        self.table.removeRow(row if row >= 0 else self.table.rowCount() - 1)
+        self.settings_changed()
+
+    def settings_changed(self):
+        self.batches = None
+        self.write_btn.setEnabled(False)
+
+    def groups(self):
+        """(deck, params) of every row."""
+        groups = []
+        for row in range(self.table.rowCount()):
+            params = dict(self.defaults)
+            params["stretch_pct"] = self.table.cellWidget(row, 1).value()
+            params["shift"] = self.table.cellWidget(row, 2).value()
+            params["max_cards_per_day"] = self.table.cellWidget(row, 3).value()
+            groups.append((self.table.cellWidget(row, 0).currentText(), params))
+        return groups
+
+    def preview(self):
+        groups = self.groups()
+        decks = [deck for deck, _ in groups]
+        if not groups:
+            tooltip("Add at least one deck.", parent=self)
+            return
+        overlap = overlapping_decks(decks)
+        if overlap:
+            showWarning(f'"{overlap[0]}" and "{overlap[1]}" overlap: each deck, '
+                        "subdecks included, can only be in one group.", parent=self)
+            return
+        budget = self.budget_spin.value()
+
+        def op(col):
+            jobs = [(snapshot_cache.get(deck, self.tags), params) for deck, params in groups]
+            return simulate_groups(jobs, daily_budget=budget, fit_horizon=True)
+
+        def done(batches):
+            self.batches = batches
+            self.write_btn.setEnabled(True)
+            self.summary.setPlainText(self.summary_text(decks, batches))
+
+        def failed(exc):
+            showWarning(str(exc), parent=self)
+
+        self.settings_changed()
+        QueryOp(parent=self, op=op, success=done).failure(failed).with_progress(
+            "Simulating deck groups…").run_in_background()
+
+    def summary_text(self, decks, batches):
+        lines = []
+        total = None
+        for deck, batch in zip(decks, batches):
+            hist = batch.histogram()
+            total = hist if total is None else [a + b for a, b in zip(total, hist)]
+            moved = len(due_date_diff(batch)[0])
+            lines.append(f"{deck}: {moved} of {len(batch)} cards move, "
+                         f"peak {max(hist, default=0)}/day")
+        lines.append(f"All groups: peak {max(total, default=0)}/day")
+        return "\n".join(lines)
+
+    def write(self):
+        if self.batches is not None:
+            self.writeRequested.emit(self.batches)
@@ -0,0 +1,150 @@
+"""
+Anki Time Warp – Instrumentation
+
+Opt-in wall-time and peak-memory recording for the preview and apply
+paths.  Nothing is measured until `instrumentation.enabled` is set;
+until then begin() hands out a no-op run, so the hooks cost nothing.
+
+    trace = instrumentation.begin("preview", deck="All")
+    with trace.stage("fetch"):
+        ...
+    trace.record("chart render", seconds)
+    trace.end()
+
+Finished runs are kept in a rolling window and, if `log_path` is set,
+appended to a JSON-lines file.  Peak memory comes from tracemalloc,
+which is only started while recording is enabled.
+"""
+
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+
+class _NullRun:
+    """Stands in for a Run while instrumentation is off."""
+
+    @contextmanager
+    def stage(self, name):
+        yield
+
+    def record(self, name, seconds, peak_bytes=None):
+        pass
+
+    def note(self, **info):
+        pass
+
+    def end(self):
+        pass
+
+
+NULL_RUN = _NullRun()
+
+
+class Run:
+    """One instrumented preview or apply: named stages plus free-form info."""
+
+    def __init__(self, owner, label, info):
+        self._owner = owner
+        self.label = label
+        self.info = dict(info)
+        self.started = time.time()
+        self.stages = []
+        self._ended = False
+
+    @contextmanager
+    def stage(self, name):
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] - base if tracing else None
+            self.record(name, seconds, peak)
+
+    def record(self, name, seconds, peak_bytes=None):
+        self.stages.append({"stage": name, "seconds": round(seconds, 6),
+                            "peak_bytes": peak_bytes})
+
+    def note(self, **info):
+        self.info.update(info)
+
+    def end(self):
+        if not self._ended:
+            self._ended = True
+            self._owner._finish(self)
+
+    def as_dict(self):
+        return {
+            "label": self.label,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S",
+                                     time.localtime(self.started)),
+            "info": self.info,
+            "stages": self.stages,
+        }
+
+
+class Instrumentation:
+    """
+    Rolling window of the last *window* runs.
+
+    enabled   – record runs at all (also starts/stops tracemalloc)
+    log_path  – append each finished run as one JSON line, or None
+    """
+
+    def __init__(self, window=20):
+        self.runs = deque(maxlen=window)
+        self.log_path = None
+        self._enabled = False
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, value):
+        self._enabled = bool(value)
+        if self._enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not self._enabled and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def begin(self, label, **info):
+        if not self._enabled:
+            return NULL_RUN
+        return Run(self, label, info)
+
+    def _finish(self, run):
+        with self._lock:
+            self.runs.append(run)
+            if self.log_path:
+                os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(run.as_dict()) + "\n")
+
+    def summary(self):
+        """Readable summary of the recorded runs, newest first."""
+        with self._lock:
+            runs = list(self.runs)
+        lines = []
+        for run in reversed(runs):
+            info = "  ".join(f"{key}={value}" for key, value in run.info.items())
+            lines.append(f"{run.as_dict()['started']}  {run.label}  {info}")
+            for stage in run.stages:
+                line = f"    {stage['stage']:<18s} {stage['seconds'] * 1000:9.2f} ms"
+                if stage["peak_bytes"] is not None:
+                    line += f"  {stage['peak_bytes'] / 1048576:8.2f} MB peak"
+                lines.append(line)
+        return "\n".join(lines)
+
+
+instrumentation = Instrumentation()
@@ -0,0 +1,203 @@
+"""
+Anki Time Warp – Warp journal
+
+Every applied warp is saved as one small file of (cid, old due, new due)
+so it can be reverted later, independent of Anki's undo stack, which is
+lost on restart or sync.
+
+File layout (little-endian):
+
+    b"TWJ1" | uint32 header length | JSON header | column blobs
+
+The header holds the metadata and, per column, the array typecode and
+blob length.  Columns are delta-encoded – cids against the previous
+(sorted) cid, old dues against the previous old due, new dues against
+their old due – narrowed to the smallest integer type that holds them,
+split into byte planes (all low bytes, then the next, …) and
+zlib-compressed, which keeps a 100k-card warp to a few hundred KB.
+"""
+
+import json
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+
+from .core import load_card_columns, write_due_dates
+
+MAGIC = b"TWJ1"
+
+# Journals kept per directory; older ones are deleted on record.
+JOURNAL_LIMIT = 50
+
+_TYPECODES = ("b", "h", "i", "q")
+
+
+def _deltas(values, base=None):
+    if base is not None:
+        return [v - b for v, b in zip(values, base)]
+    out = []
+    previous = 0
+    for v in values:
+        out.append(v - previous)
+        previous = v
+    return out
+
+
+def _undelta(deltas, base=None):
+    if base is not None:
+        return [d + b for d, b in zip(deltas, base)]
+    out = []
+    total = 0
+    for d in deltas:
+        total += d
+        out.append(total)
+    return out
+
+
+def _pack(values):
+    """(typecode, compressed bytes) of *values* in the narrowest type."""
+    low, high = (min(values), max(values)) if values else (0, 0)
+    for typecode in _TYPECODES:
+        bits = array(typecode).itemsize * 8 - 1
+        if -(1 << bits) <= low and high < (1 << bits):
+            break
+    packed = array(typecode, values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    raw = packed.tobytes()
+    size = packed.itemsize
+    planes = b"".join(raw[plane::size] for plane in range(size))
+    return typecode, zlib.compress(planes, 9)
+
+
+def _unpack(typecode, blob):
+    values = array(typecode)
+    planes = zlib.decompress(blob)
+    size = values.itemsize
+    count = len(planes) // size
+    raw = bytearray(len(planes))
+    for plane in range(size):
+        raw[plane::size] = planes[plane * count:(plane + 1) * count]
+    values.frombytes(bytes(raw))
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tolist()
+
+
+def record_warp(directory, cids, old_dues, new_dues, limit=JOURNAL_LIMIT, **meta):
+    """
+    Save one warp to *directory* and prune it to the newest *limit*
+    journals.  *meta* (deck, settings, …) is stored in the header.
+    Returns the journal's path.
+    """
+    rows = sorted(zip((int(c) for c in cids), (int(d) for d in old_dues),
+                      (int(d) for d in new_dues)))
+    cid_col = [row[0] for row in rows]
+    old_col = [row[1] for row in rows]
+    new_col = [row[2] for row in rows]
+
+    columns = []
+    blobs = []
+    for name, values in (("cid", _deltas(cid_col)),
+                         ("old_due", _deltas(old_col)),
+                         ("new_due", _deltas(new_col, old_col))):
+        typecode, blob = _pack(values)
+        columns.append({"name": name, "type": typecode, "bytes": len(blob)})
+        blobs.append(blob)
+
+    created = time.time()
+    header = json.dumps({
+        "created": created,
+        "cards": len(rows),
+        "meta": meta,
+        "columns": columns,
+    }).encode("utf-8")
+
+    os.makedirs(directory, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(created))
+    number = 0
+    while True:
+        path = os.path.join(directory, f"warp-{stamp}-{number:03d}.twj")
+        if not os.path.exists(path):
+            break
+        number += 1
+    with open(path, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(header)) + header)
+        for blob in blobs:
+            f.write(blob)
+    prune(directory, limit)
+    return path
+
+
+def _read_header(f):
+    if f.read(4) != MAGIC:
+        raise ValueError("not a Time Warp journal")
+    (length,) = struct.unpack("<I", f.read(4))
+    return json.loads(f.read(length).decode("utf-8"))
+
+
+def load_warp(path):
+    """(header, cids, old_dues, new_dues) of the journal at *path*."""
+    with open(path, "rb") as f:
+        header = _read_header(f)
+        columns = {column["name"]: _unpack(column["type"], f.read(column["bytes"]))
+                   for column in header["columns"]}
+    cids = _undelta(columns["cid"])
+    old_dues = _undelta(columns["old_due"])
+    new_dues = _undelta(columns["new_due"], old_dues)
+    return header, cids, old_dues, new_dues
+
+
+def list_warps(directory):
+    """Headers of the journals in *directory*, newest first, each with its "path"."""
+    if not os.path.isdir(directory):
+        return []
+    warps = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if not name.endswith(".twj"):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            with open(path, "rb") as f:
+                header = _read_header(f)
+        except (OSError, ValueError):
+            continue
+        header["path"] = path
+        warps.append(header)
+    return warps
+
+
+def prune(directory, limit=JOURNAL_LIMIT):
+    """Delete all but the newest *limit* journals in *directory*."""
+    for header in list_warps(directory)[limit:]:
+        os.remove(header["path"])
+
+
+def revert_warp(path, progress=None, should_cancel=None, return_changes=False):
+    """
+    Put the cards of the journal at *path* back on their old due dates
+    in one bulk write (a single "Revert Time Warp" undo step).
+
+    Only cards still due where the warp put them are reverted; cards
+    reviewed, rescheduled or deleted since keep their current state.
+    Returns (reverted, skipped), or with *return_changes* (reverted,
+    skipped, changes) – see write_due_dates().
+    """
+    _, cids, old_dues, new_dues = load_warp(path)
+    current = load_card_columns(cids)
+    current_due = dict(zip(current["cid"], current["due"]))
+    revert_cids = []
+    revert_dues = []
+    for cid, old, new in zip(cids, old_dues, new_dues):
+        if current_due.get(cid) == new:
+            revert_cids.append(cid)
+            revert_dues.append(old)
+    reverted, changes = write_due_dates(revert_cids, revert_dues, progress=progress,
+                                        undo_name="Revert Time Warp",
+                                        should_cancel=should_cancel, return_changes=True)
+    if return_changes:
+        return reverted, len(cids) - reverted, changes
+    return reverted, len(cids) - reverted
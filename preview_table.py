@@ -0,0 +1,283 @@
+"""
+Anki Time Warp – Change preview
+
+A table of the cards a warp would move, shown before writing.  The model
+works straight on the (cid, old due, new due) columns of
+core.due_date_diff(): rows are formatted only when the view asks for
+them and are handed to the view a page at a time (canFetchMore /
+fetchMore), so a 100k-card warp opens instantly.  Sorting and filtering
+only permute an index array; the CSV export streams rows to the file.
+"""
+
+import csv
+from datetime import date, timedelta
+
+from aqt.operations import QueryOp
+from aqt.utils import showWarning, tooltip
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, QPushButton,
+    QTableView, QHeaderView, QFileDialog, QDialogButtonBox
+)
+
+from .core import np, DISPLACEMENT_BINS
+
+# Rows handed to the view per fetchMore().
+PAGE_SIZE = 500
+
+# Rows written per csv.writerows() call during an export.
+EXPORT_CHUNK = 5000
+
+COLUMNS = ("Card ID", "Deck", "Due now", "Due after warp", "Days moved")
+
+
+def displacement_label(low, high):
+    if low is None:
+        return f"≤ {high:+d}"
+    if high is None:
+        return f"≥ {low:+d}"
+    if low == high:
+        return f"{low:+d}"
+    return f"{low:+d} … {high:+d}"
+
+
+def scheduler_day_zero(day_cutoff, today):
+    """
+    Calendar date of scheduler day 0, given col.sched.day_cutoff (epoch
+    seconds of the next rollover) and col.sched.today.  The scheduler's
+    today is the local date the current day started on, which between
+    midnight and the rollover hour is still yesterday.
+    """
+    return date.fromtimestamp(day_cutoff - 86400) - timedelta(days=today)
+
+
+def _as_list(values):
+    return values.tolist() if hasattr(values, "tolist") else list(values)
+
+
+class ChangeTableModel(QAbstractTableModel):
+    """
+    Read-only model over parallel cid / did / old due / new due columns.
+
+    `order` holds the row → card index mapping after sorting and
+    filtering; only its first `loaded` entries are exposed to the view.
+    """
+
+    def __init__(self, cids, dids, old_dues, new_dues, deck_names, day_zero,
+                 parent=None):
+        super().__init__(parent)
+        self.cid = _as_list(cids)
+        self.did = _as_list(dids)
+        self.old_due = _as_list(old_dues)
+        self.new_due = _as_list(new_dues)
+        self.moved = [new - old for old, new in zip(self.old_due, self.new_due)]
+        self.deck_names = dict(deck_names)
+        self.day_zero = day_zero  # date of day number 0, for showing dues as dates
+        self.deck_filter = None
+        self.moved_filter = (None, None)
+        self.sort_column = 0
+        self.sort_order = Qt.SortOrder.AscendingOrder
+        self.order = list(range(len(self.cid)))
+        self.loaded = min(PAGE_SIZE, len(self.order))
+
+    # ----- Qt model interface -----
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.loaded
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            return COLUMNS[section]
+        return section + 1
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.ItemDataRole.TextAlignmentRole and index.column() != 1:
+            return Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        return self.row_values(self.order[index.row()])[index.column()]
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.loaded < len(self.order)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        more = min(PAGE_SIZE, len(self.order) - self.loaded)
+        if more <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.loaded, self.loaded + more - 1)
+        self.loaded += more
+        self.endInsertRows()
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        self.sort_column = column
+        self.sort_order = order
+        self.refresh()
+
+    # ----- rows -----
+
+    def due_text(self, due):
+        return (self.day_zero + timedelta(days=due)).isoformat()
+
+    def row_values(self, i):
+        """Display values of card *i*, in COLUMNS order."""
+        return (
+            str(self.cid[i]),
+            self.deck_names.get(self.did[i], "?"),
+            self.due_text(self.old_due[i]),
+            self.due_text(self.new_due[i]),
+            f"{self.moved[i]:+d}",
+        )
+
+    def set_filter(self, deck=None, moved=(None, None)):
+        """Show only cards of deck id *deck* moved within the (low, high) days."""
+        self.deck_filter = deck
+        self.moved_filter = moved
+        self.refresh()
+
+    def refresh(self):
+        """Recompute `order` from the filter and sort settings."""
+        self.beginResetModel()
+        self.order = self._ordered(self._filtered())
+        self.loaded = min(PAGE_SIZE, len(self.order))
+        self.endResetModel()
+
+    def _filtered(self):
+        low, high = self.moved_filter
+        deck = self.deck_filter
+        if deck is None and low is None and high is None:
+            return range(len(self.cid))
+        if np is not None:
+            keep = np.ones(len(self.cid), dtype=bool)
+            moved = np.asarray(self.moved)
+            if deck is not None:
+                keep &= np.asarray(self.did) == deck
+            if low is not None:
+                keep &= moved >= low
+            if high is not None:
+                keep &= moved <= high
+            return np.nonzero(keep)[0]
+        return [i for i in range(len(self.cid))
+                if (deck is None or self.did[i] == deck)
+                and (low is None or self.moved[i] >= low)
+                and (high is None or self.moved[i] <= high)]
+
+    def _sort_keys(self):
+        if self.sort_column == 1:
+            ranks = {did: rank for rank, did in enumerate(
+                sorted(self.deck_names, key=lambda did: self.deck_names[did].lower()))}
+            return [ranks.get(did, -1) for did in self.did]
+        return (self.cid, None, self.old_due, self.new_due, self.moved)[self.sort_column]
+
+    def _ordered(self, indices):
+        keys = self._sort_keys()
+        descending = self.sort_order == Qt.SortOrder.DescendingOrder
+        if np is not None:
+            indices = np.asarray(indices, dtype=np.int64)
+            order = indices[np.argsort(np.asarray(keys)[indices], kind="stable")]
+            return (order[::-1] if descending else order).tolist()
+        return sorted(indices, key=keys.__getitem__, reverse=descending)
+
+    def export_csv(self, path, progress=None):
+        """
+        Write every row matching the current filter, in the current order,
+        to *path*.  Rows are formatted chunk by chunk as they are written;
+        *progress(done, total)* is called after each chunk.  Returns the
+        number of rows written.
+        """
+        order = self.order
+        total = len(order)
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(("cid", "deck", "old_due_date", "new_due_date", "days_moved"))
+            for start in range(0, total, EXPORT_CHUNK):
+                writer.writerows(self.row_values(i)
+                                 for i in order[start:start + EXPORT_CHUNK])
+                if progress is not None:
+                    progress(min(start + EXPORT_CHUNK, total), total)
+        return total
+
+
+class ChangePreviewDialog(QDialog):
+    """
+    Confirmation dialog listing the pending due date changes.  Accepting
+    it means "write these changes".
+    """
+
+    def __init__(self, model, message, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Time Warp – Pending changes")
+        self.resize(760, 520)
+        self.model = model
+        model.setParent(self)
+
+        self.deck_select = QComboBox()
+        self.deck_select.addItem("All decks", None)
+        for did, name in sorted(model.deck_names.items(), key=lambda item: item[1].lower()):
+            self.deck_select.addItem(name, did)
+        self.moved_select = QComboBox()
+        self.moved_select.addItem("Any move", (None, None))
+        for low, high in DISPLACEMENT_BINS:
+            self.moved_select.addItem(f"{displacement_label(low, high)} days", (low, high))
+        self.count_label = QLabel()
+        export_btn = QPushButton("Export CSV…")
+        export_btn.clicked.connect(self.export)
+
+        self.table = QTableView()
+        self.table.setModel(model)
+        self.table.setSortingEnabled(True)
+        self.table.sortByColumn(4, Qt.SortOrder.DescendingOrder)
+        self.table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.table.verticalHeader().setVisible(False)
+
+        filters = QHBoxLayout()
+        filters.addWidget(QLabel("Show:"))
+        filters.addWidget(self.deck_select)
+        filters.addWidget(self.moved_select)
+        filters.addStretch()
+        filters.addWidget(self.count_label)
+        filters.addWidget(export_btn)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok
+                                   | QDialogButtonBox.StandardButton.Cancel)
+        buttons.button(QDialogButtonBox.StandardButton.Ok).setText("Write changes")
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel(message))
+        layout.addLayout(filters)
+        layout.addWidget(self.table)
+        layout.addWidget(buttons)
+
+        self.deck_select.currentIndexChanged.connect(self.apply_filter)
+        self.moved_select.currentIndexChanged.connect(self.apply_filter)
+        self.update_count()
+
+    def apply_filter(self):
+        self.model.set_filter(self.deck_select.currentData(),
+                              self.moved_select.currentData())
+        self.update_count()
+
+    def update_count(self):
+        self.count_label.setText(f"{len(self.model.order)} of {len(self.model.cid)} cards")
+
+    def export(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export changes", "time_warp_changes.csv",
+                                              "CSV files (*.csv)")
+        if not path:
+            return
+        QueryOp(parent=self, op=lambda col: self.model.export_csv(path),
+                success=lambda rows: tooltip(f"Exported {rows} rows.", parent=self)
+                ).failure(lambda exc: showWarning(str(exc), parent=self)
+                          ).with_progress("Exporting changes…").run_in_background()
+
@@ -0,0 +1,143 @@
+from aqt.operations import QueryOp
+from aqt.utils import showWarning
+from PyQt6.QtCore import Qt, pyqtSignal
+from PyQt6.QtGui import QColor
+from PyQt6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, QTableWidget,
+    QTableWidgetItem, QHeaderView
+)
+
+from .core import snapshot_cache, sweep_parameters, SWEEP_METRICS
+
+# Grids explored by the dialog: a coarse grid over the middle of the main
+# dialog's slider ranges (stretch -100..500 %, shift -30..30 days), which
+# keeps a sweep to 165 simulations per cap.
+SWEEP_STRETCHES = tuple(range(-50, 301, 25))
+SWEEP_SHIFTS = tuple(range(-10, 11, 2))
+
+METRIC_LABELS = {
+    "peak": "Peak day (cards)",
+    "p95": "95th percentile day (cards)",
+    "tail": "Tail length (days)",
+    "mean_displacement": "Mean displacement (days)",
+}
+
+
+def cap_label(cap):
+    if cap < 0:
+        return "No cap"
+    if cap == 0:
+        return "Auto cap"
+    return f"Cap {cap}/day"
+
+
+class SweepDialog(QDialog):
+    """
+    Heatmap of sweep_parameters() over the stretch × shift grid, one cap
+    at a time.  Lower is better for every metric (green); clicking a cell
+    emits settingsPicked(stretch, shift, cap).
+    """
+
+    settingsPicked = pyqtSignal(int, int, int)
+
+    def __init__(self, deck, tags, caps, collapse_overdues=False,
+                 max_displacement=None, day_capacity=None, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Time Warp – Explore settings")
+        self.resize(900, 520)
+        self.deck = deck
+        self.tags = list(tags)
+        self.caps = list(caps)
+        self.collapse_overdues = collapse_overdues
+        self.max_displacement = max_displacement
+        self.day_capacity = day_capacity
+        self.results = {}
+        self.closed = False  # read by the background sweep, so no widget calls there
+        self.finished.connect(self.mark_closed)
+
+        self.metric_select = QComboBox()
+        for metric in SWEEP_METRICS:
+            self.metric_select.addItem(METRIC_LABELS[metric], metric)
+        self.cap_select = QComboBox()
+        for cap in self.caps:
+            label = cap_label(cap)
+            if cap > 0 and day_capacity:
+                label += " (weekly pattern)"
+            self.cap_select.addItem(label, cap)
+        self.status_label = QLabel("Computing…")
+
+        self.table = QTableWidget(len(SWEEP_STRETCHES), len(SWEEP_SHIFTS))
+        self.table.setVerticalHeaderLabels([f"{s}%" for s in SWEEP_STRETCHES])
+        self.table.setHorizontalHeaderLabels([f"{s:+d}" for s in SWEEP_SHIFTS])
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.table.cellClicked.connect(self.pick_cell)
+
+        controls = QHBoxLayout()
+        controls.addWidget(QLabel("Show:"))
+        controls.addWidget(self.metric_select)
+        controls.addWidget(self.cap_select)
+        controls.addStretch()
+        controls.addWidget(self.status_label)
+
+        layout = QVBoxLayout(self)
+        layout.addLayout(controls)
+        layout.addWidget(QLabel("Rows: stretch, columns: shift (days). "
+                                "Click a cell to use its settings."))
+        layout.addWidget(self.table)
+
+        self.metric_select.currentIndexChanged.connect(self.fill_table)
+        self.cap_select.currentIndexChanged.connect(self.fill_table)
+
+        self.compute()
+
+    def compute(self):
+        def op(col):
+            batch = snapshot_cache.get(self.deck, self.tags)
+            return sweep_parameters(
+                batch, SWEEP_STRETCHES, SWEEP_SHIFTS, self.caps, fit_horizon=True,
+                collapse_overdues=self.collapse_overdues,
+                max_displacement=self.max_displacement,
+                day_capacity=self.day_capacity,
+                should_stop=lambda: self.closed)
+
+        def done(results):
+            if results is None:
+                return
+            self.results = {(r["stretch_pct"], r["shift"], r["max_cards_per_day"]): r
+                            for r in results}
+            self.status_label.setText(f"{len(results)} combinations")
+            self.fill_table()
+
+        def failed(exc):
+            self.status_label.setText("Failed.")
+            showWarning(str(exc), parent=self)
+
+        QueryOp(parent=self, op=op, success=done).failure(failed).run_in_background()
+
+    def mark_closed(self):
+        self.closed = True
+
+    def fill_table(self):
+        if not self.results:
+            return
+        metric = self.metric_select.currentData()
+        cap = self.cap_select.currentData()
+        values = [[self.results[(stretch, shift, cap)][metric] for shift in SWEEP_SHIFTS]
+                  for stretch in SWEEP_STRETCHES]
+        low = min(min(row) for row in values)
+        high = max(max(row) for row in values)
+        for row, row_values in enumerate(values):
+            for column, value in enumerate(row_values):
+                text = f"{value:.1f}" if isinstance(value, float) else str(value)
+                item = QTableWidgetItem(text)
+                item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
+                # green (low) → red (high)
+                t = (value - low) / (high - low) if high > low else 0.0
+                item.setBackground(QColor.fromHsvF((1 - t) / 3, 0.45, 0.95))
+                item.setForeground(QColor("black"))
+                self.table.setItem(row, column, item)
+
+    def pick_cell(self, row, column):
+        self.settingsPicked.emit(SWEEP_STRETCHES[row], SWEEP_SHIFTS[column],
+                                 self.cap_select.currentData())
@@ -0,0 +1,132 @@
+"""
+Anki Time Warp – Tag index
+
+Completion index over the collection's tags, built for collections with
+tens of thousands of hierarchical "::" tags.
+
+  prefix    – bisect over the sorted, lower-cased tag names
+  segment   – bisect over every "::" segment suffix ("b::c" of "a::b::c")
+  substring – str.find over one newline-joined copy of the names
+
+Each lookup touches only the matches it returns, so a search stays well
+under a frame.  Card counts come from one grouped query over the notes'
+tag strings; a parent tag counts the cards of its children too, the way
+a tag:"a::b" search does.
+"""
+
+from bisect import bisect_left
+
+# Suggestions returned per search.
+SEARCH_LIMIT = 50
+
+# The completion index of each collection, kept until clear_tag_indexes().
+_indexes = {}
+
+
+class TagIndex:
+    """
+    Searchable list of tag names.
+
+    `tags` and `counts` are parallel lists sorted case-insensitively;
+    search() returns indices into them.
+    """
+
+    def __init__(self, tags, counts=None):
+        self.tags = sorted(tags, key=str.lower)
+        self.keys = [tag.lower() for tag in self.tags]
+        counts = {key.lower(): count for key, count in (counts or {}).items()}
+        self.counts = [counts.get(key, 0) for key in self.keys]
+
+        segments = []
+        for i, key in enumerate(self.keys):
+            start = key.find("::")
+            while start != -1:
+                segments.append((key[start + 2:], i))
+                start = key.find("::", start + 2)
+        segments.sort()
+        self.segment_keys = [segment for segment, _ in segments]
+        self.segment_tags = [i for _, i in segments]
+
+        self.blob = "\n".join(self.keys)
+        self.line_starts = []
+        offset = 0
+        for key in self.keys:
+            self.line_starts.append(offset)
+            offset += len(key) + 1
+
+    def __len__(self):
+        return len(self.tags)
+
+    def search(self, text, limit=SEARCH_LIMIT):
+        """
+        Indices of up to *limit* tags matching *text*: tags starting with
+        it first, then tags with a "::" segment starting with it, then
+        tags containing it anywhere.
+        """
+        needle = text.strip().lower()
+        if not needle:
+            return []
+        found = []
+        seen = set()
+
+        def take(i):
+            if i not in seen:
+                seen.add(i)
+                found.append(i)
+            return len(found) >= limit
+
+        i = bisect_left(self.keys, needle)
+        while i < len(self.keys) and self.keys[i].startswith(needle):
+            if take(i):
+                return found
+            i += 1
+
+        i = bisect_left(self.segment_keys, needle)
+        while i < len(self.segment_keys) and self.segment_keys[i].startswith(needle):
+            if take(self.segment_tags[i]):
+                return found
+            i += 1
+
+        if "\n" in needle:
+            return found
+        start = self.blob.find(needle)
+        while start != -1:
+            line = bisect_left(self.line_starts, start + 1) - 1
+            if take(line):
+                return found
+            # continue after this tag, one match per tag is enough
+            start = self.blob.find(needle, self.line_starts[line] + len(self.keys[line]))
+        return found
+
+
+def tag_card_counts(col):
+    """
+    Unsuspended cards per lower-cased tag, including the cards of child
+    tags, from one query grouped by the notes' tag strings.
+    """
+    counts = {}
+    rows = col.db.all(
+        "select n.tags, count() from cards c join notes n on n.id = c.nid "
+        "where c.queue != -1 group by n.tags")
+    for tag_string, cards in rows:
+        names = set()
+        for tag in tag_string.lower().split():
+            parts = tag.split("::")
+            for depth in range(1, len(parts) + 1):
+                names.add("::".join(parts[:depth]))
+        for name in names:
+            counts[name] = counts.get(name, 0) + cards
+    return counts
+
+
+def tag_index(col):
+    """The TagIndex of *col*, built on first use and then reused."""
+    index = _indexes.get(col.path)
+    if index is None:
+        index = _indexes[col.path] = TagIndex(col.tags.all(), tag_card_counts(col))
+    return index
+
+
+def clear_tag_indexes():
+    """Drop the built indexes so added or renamed tags are picked up."""
+    _indexes.clear()
@@ -1,6 +1,6 @@
 from PyQt6.QtWidgets import QWidget, QLineEdit, QHBoxLayout, QLabel, QPushButton, QCompleter
 from PyQt6.QtCore import Qt, pyqtSignal
-from PyQt6.QtGui import QKeyEvent
+from PyQt6.QtGui import QKeyEvent, QStandardItem, QStandardItemModel
 
 class TagChip(QWidget):
     def __init__(self, tag, parent_layout):
@@ -36,12 +36,24 @@ class TagChip(QWidget):
         self.parent_layout.input.setFocus()
 
 class TagInputWidget(QWidget):
+    """
+    Tag chips plus a line edit with tag suggestions.
+
+    *load_index(on_ready, on_failed)* starts building a tag_index.TagIndex
+    and calls on_ready(index) once it is available, or on_failed(exc); it
+    is called on the first keystroke, and again after a failure or
+    reset_index().  Suggestions show each tag's card count, while the bare
+    tag name (UserRole) is what gets inserted.
+    """
+
     tagChanged = pyqtSignal()
 
-    def __init__(self, tag_list):
+    def __init__(self, load_index):
         super().__init__()
         self.tags = []
-        self.tag_list = tag_list
+        self.load_index = load_index
+        self.index = None
+        self.index_requested = False
 
         self.layout = QHBoxLayout(self)
         self.layout.setSpacing(4)
@@ -51,13 +63,47 @@ class TagInputWidget(QWidget):
         self.input.setPlaceholderText("Type and press Enter to confirm tag")
         self.input.returnPressed.connect(self.add_tag_from_input)
 
-        self.completer = QCompleter(tag_list)
-        self.completer.setCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+        self.suggestions = QStandardItemModel(self)
+        self.completer = QCompleter(self.suggestions, self)
+        self.completer.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
+        self.completer.setCompletionRole(Qt.ItemDataRole.UserRole)
         self.completer.activated.connect(self.insert_completion_only)
         self.input.setCompleter(self.completer)
+        self.input.textEdited.connect(self.update_suggestions)
 
         self.layout.addWidget(self.input)
 
+    def set_index(self, index):
+        self.index = index
+        self.update_suggestions(self.input.text())
+
+    def index_failed(self, exc):
+        self.index_requested = False  # try again on the next keystroke
+
+    def reset_index(self):
+        """Drop the index; the next keystroke loads a fresh one."""
+        self.index = None
+        self.index_requested = False
+        self.suggestions.clear()
+
+    def update_suggestions(self, text):
+        if self.index is None:
+            if not self.index_requested:
+                self.index_requested = True
+                self.load_index(self.set_index, self.index_failed)
+            return
+        self.suggestions.clear()
+        for i in self.index.search(text):
+            tag = self.index.tags[i]
+            item = QStandardItem(f"{tag}  ({self.index.counts[i]})")
+            item.setData(tag, Qt.ItemDataRole.UserRole)
+            item.setEditable(False)
+            self.suggestions.appendRow(item)
+        if self.suggestions.rowCount() and self.input.hasFocus():
+            self.completer.complete()
+        else:
+            self.completer.popup().hide()
+
     def insert_completion_only(self, tag):
         self.input.setText(tag)
         self.input.setFocus()
@@ -1,43 +1,65 @@
+from anki.collection import OpChanges
 from aqt import mw
+from aqt.operations import CollectionOp, QueryOp
+from aqt.utils import showWarning, tooltip
 from PyQt6.QtGui import QPixmap
 from PyQt6.QtCore import Qt, QSize, QTimer
 from PyQt6.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, QSlider, QPushButton,
-    QCheckBox, QMessageBox, QSizePolicy, QScrollArea, QWidget, QSpinBox
+    QCheckBox, QMessageBox, QSizePolicy, QScrollArea, QWidget, QSpinBox,
+    QToolButton, QPlainTextEdit, QInputDialog
 )
 from PyQt6.QtWebEngineWidgets import QWebEngineView
 
 from .core import (
-    fetch_cards, get_card_data, simulate_review_timeline,
-    compute_due_matrix, sum_matrix_columns, apply_transformed_due_dates
+    snapshot_cache, simulate_review_timeline, SimulationPipeline, PreviewCache,
+    timeline_histogram, weekly_capacity,
+    create_filtered_deck_from_transformed, ApplyCancelled, write_due_dates, due_date_diff,
+    displacement_histogram, DISPLACEMENT_BINS, load_card_decks, merge_diffs
 )
+from .groups_dialog import GroupsDialog, subdecks
+from .instrumentation import instrumentation
+from .journal import record_warp, list_warps, revert_warp
+from .preview_table import (
+    ChangeTableModel, ChangePreviewDialog, displacement_label, scheduler_day_zero
+)
+from .sweep_dialog import SweepDialog
+from .tag_index import tag_index, clear_tag_indexes
 from .tag_input_widget import TagInputWidget
-from datetime import date
+from datetime import date, timedelta
+import json
 import os
+import time
 from .core import shuffle_new_cards as shuffle_cards, set_all_to_new as set_cards_as_new
 
 # Prevent multiple instances
 dialog_instance = None
 
-def build_chart_html(hist, labels, max_cap=0, y_max=None):
+def next_y_max(current, peak):
+    """Y-axis stability: only rescale upward when peak > 75% of current max."""
+    if current == 0:
+        # First render: set y_max to peak with 10% headroom
+        return max(1, int(peak * 1.1))
+    if peak > current * 0.75:
+        # Peak grew beyond 75% of Y-axis: rescale up
+        return max(current, int(peak * 1.1))
+    # Otherwise: keep current y_max (bars shrink within stable axis)
+    return current
+
+
+def build_chart_html(hist=(), labels=(), max_cap=0, y_max=None):
+    """
+    The chart page, loaded once per dialog.
+
+    Later updates go through updateChart() (see chart_update_js), which
+    swaps the data of the existing Chart instance instead of reloading
+    the page.
+    """
     chart_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "chart.min.js"))
     with open(chart_path, "r", encoding="utf-8") as f:
         chartjs = f.read()
 
-    # Build a flat line for the cap (if any)
-    cap_js_dataset = ""
-    if max_cap and int(max_cap) > 0:
-        cap_values = ",".join([str(int(max_cap)) for _ in range(len(labels))])
-        cap_js_dataset = f""",
-            {{
-                type: 'line',
-                label: 'Cap',
-                data: [{cap_values}],
-                borderDash: [6,4],
-                fill: false,
-                pointRadius: 0,
-                borderWidth: 1
-            }}"""
+    initial = chart_payload(hist, labels, max_cap, y_max)
 
     return f"""
 <!DOCTYPE html>
@@ -66,28 +88,44 @@ def build_chart_html(hist, labels, max_cap=0, y_max=None):
 </div>
 <script>
 const ctx = document.getElementById('timeWarpChart').getContext('2d');
-new Chart(ctx, {{
+const chart = new Chart(ctx, {{
     type: 'bar',
     data: {{
-        labels: {labels},
+        labels: [],
         datasets: [
             {{
                 label: 'Overdue',
-                data: {hist},
+                data: [],
                 backgroundColor: function(context) {{
                     const index = context.dataIndex;
                     const label = context.chart.data.labels[index];
                     return parseInt(label) < 0 ? 'rgba(255, 0, 0, 0.8)' : 'rgba(0, 123, 255, 0.8)';
                 }},
                 barThickness: 10
+            }},
+            {{
+                type: 'line',
+                label: 'Cap',
+                data: [],
+                borderDash: [6,4],
+                fill: false,
+                pointRadius: 0,
+                borderWidth: 1
             }}
-            {cap_js_dataset}
         ]
     }},
     options: {{
         responsive: false,
         maintainAspectRatio: false,
         plugins: {{
+            legend: {{
+                labels: {{
+                    // hide the cap entry while no cap is set
+                    filter: function(item, data) {{
+                        return data.datasets[item.datasetIndex].data.length > 0;
+                    }}
+                }}
+            }},
             tooltip: {{
                 callbacks: {{
                     label: function(context) {{
@@ -110,31 +148,123 @@ new Chart(ctx, {{
                     display: true,
                     text: 'Number of Cards'
                 }},
-                beginAtZero: true{', max: ' + str(y_max) if y_max else ''}
+                beginAtZero: true
             }}
         }}
     }}
 }});
+
+function updateChart(payload, animate) {{
+    chart.data.labels = payload.labels;
+    chart.data.datasets[0].data = payload.hist;
+    chart.data.datasets[1].data = Array.isArray(payload.cap) ? payload.cap
+        : payload.cap > 0 ? payload.labels.map(() => payload.cap) : [];
+    chart.options.scales.y.max = payload.yMax || undefined;
+    chart.update(animate ? undefined : 'none');
+}}
+
+updateChart({json.dumps(initial)}, true);
 </script>
 </body>
 </html>
 """
 
 
-def create_filtered_deck_from_transformed(card_data):
-    deck_name = "TimeWarpFiltered"
-    deck_id = mw.col.decks.id(deck_name)
-    mw.col.decks.select(deck_id)
-    mw.col.sched.unbury_cards()
-    mw.col.decks.get(deck_id)["dyn"] = True
-    mw.col.decks.get(deck_id)["terms"] = [[1, "cid:" + " OR cid:".join(str(card["cid"]) for card in card_data), 0]]
-    mw.col.decks.get(deck_id)["resched"] = True
-    mw.col.decks.save(deck_id)
-    mw.col.sched.rebuild_filtered_deck(deck_id)
-
-def clear_dialog_instance():
+def chart_payload(hist, labels, max_cap=0, y_max=None):
+    """*max_cap* is one cap for every day or a list with one cap per label."""
+    if isinstance(max_cap, (list, tuple)):
+        cap = [int(v) for v in max_cap]
+    else:
+        cap = int(max_cap) if max_cap and int(max_cap) > 0 else 0
+    return {
+        "hist": [int(v) for v in hist],
+        "labels": list(labels),
+        "cap": cap,
+        "yMax": y_max or 0,
+    }
+
+
+def chart_update_js(hist, labels, max_cap=0, y_max=None):
+    """JavaScript that pushes new data into the already loaded chart page."""
+    return f"updateChart({json.dumps(chart_payload(hist, labels, max_cap, y_max))}, false);"
+
+
+def chart_window(hist, first_offset, view_from, view_to, max_cap=0, day_capacity=None):
+    """
+    Cut the chart data for days view_from..view_to-1 (relative to today)
+    out of a simulated timeline whose *hist* starts *first_offset* days
+    from today.  Days the timeline does not cover show as empty.
+
+    Returns (chart_hist, labels, cap_line).
+    """
+    days = range(view_from, view_to)
+    chart_hist = [hist[day - first_offset] if 0 <= day - first_offset < len(hist) else 0
+                  for day in days]
+    labels = [str(day) for day in days]
+    cap_line = max_cap
+    if day_capacity:
+        cap_line = [day_capacity[day % len(day_capacity)] for day in days]
+    return chart_hist, labels, cap_line
+
+
+# Slider offsets precomputed around the current position while scrubbing.
+SCRUB_STRETCH_STEPS = (1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 25, 30, 40, 50)
+SCRUB_SHIFT_STEPS = (1, 2, 3, 4, 5)
+
+
+def nearby_positions(stretch, shift, stretch_range, shift_range):
+    """(stretch, shift) positions around the current one, nearest first, within the slider ranges."""
+    positions = [(stretch, shift)]
+    for step in sorted(set(SCRUB_STRETCH_STEPS) | set(SCRUB_SHIFT_STEPS)):
+        if step in SCRUB_SHIFT_STEPS:
+            positions += [(stretch, value) for value in (shift - step, shift + step)
+                          if shift_range[0] <= value <= shift_range[1]]
+        if step in SCRUB_STRETCH_STEPS:
+            positions += [(value, shift) for value in (stretch - step, stretch + step)
+                          if stretch_range[0] <= value <= stretch_range[1]]
+    return positions
+
+
+def diff_summary_text(changed, placed, counts, bins=DISPLACEMENT_BINS, width=30):
+    """Cards to rewrite plus a text histogram of how far they move."""
+    lines = [f"Cards to rewrite: {changed} of {placed} placed"]
+    peak = max(counts, default=0)
+    for (low, high), count in zip(bins, counts):
+        if not count:
+            continue
+        bar = "█" * max(1, round(width * count / peak))
+        lines.append(f"{displacement_label(low, high):>10} days  {bar} {count}")
+    return "\n".join(lines)
+
+
+def scheduler_weekday(col, offset=0):
+    """
+    Weekday (0 = Monday) of the scheduler day *offset* days after today –
+    slot days follow the rollover hour, not local midnight.
+    """
+    today = col.sched.today
+    day_zero = scheduler_day_zero(col.sched.day_cutoff, today)
+    return (day_zero + timedelta(days=today + offset)).weekday()
+
+
+def load_tag_index(on_ready, on_failed):
+    """
+    Hand the collection's tag index to *on_ready*, building it in the
+    background if needed; *on_failed(exc)* is called if that fails.
+    """
+    QueryOp(parent=mw, op=tag_index, success=on_ready).failure(on_failed).run_in_background()
+
+
+def discard_dialog():
+    """Drop the kept dialog, e.g. before its profile's collection closes."""
     global dialog_instance
+    clear_tag_indexes()
+    if dialog_instance is None:
+        return
+    dialog_instance.reject()
+    dialog_instance.deleteLater()
     dialog_instance = None
+    snapshot_cache.invalidate()
 
 def launch_timewarp():
     global dialog_instance
@@ -142,9 +272,20 @@ def launch_timewarp():
         dialog_instance.raise_()
         dialog_instance.activateWindow()
         return
+    if dialog_instance is not None:
+        # Closing only hides the dialog; reopening reuses its widgets,
+        # deck list and loaded chart page.
+        dialog_instance.reopen()
+        dialog_instance.exec()
+        return
 
-    card_data_transformed = []
+    card_data_transformed = None
+    card_diff = None  # (cids, old dues, new dues) of the cards the preview moves
     chart_y_max = [0]  # mutable container so inner function can update
+    preview_generation = [0]  # bumped per preview run; older runs are dropped
+    preview_timeline = [None]  # (hist, first_offset, max_cap, day_capacity) of the last preview
+    preview_pipeline = SimulationPipeline()  # memoizes unchanged stages
+    preview_cache = PreviewCache()  # timelines of nearby slider positions, filled in the background
 
     dialog_instance = QDialog()
     dialog_instance.setWindowTitle("Anki Time Warp")
@@ -171,7 +312,7 @@ def launch_timewarp():
     deck_select.setFixedWidth(800)
 
     tag_widget_label = QLabel("Tags:")
-    tag_widget = TagInputWidget(mw.col.tags.all())
+    tag_widget = TagInputWidget(load_tag_index)
     tag_widget.setFixedWidth(800)
 
     deck_tag_container.addWidget(deck_select_label)
@@ -217,15 +358,54 @@ def launch_timewarp():
     max_per_day_spin.setValue(-1)
     max_per_day_spin.setToolTip("-1 = off (stretch controls distribution).\n0 = auto-flatten.\n>0 = manual cap per day.")
 
+    weekend_cap_label = QLabel("Max cards/day on weekends:")
+    weekend_cap_spin = QSpinBox()
+    weekend_cap_spin.setRange(-1, 100000)
+    weekend_cap_spin.setValue(-1)
+    weekend_cap_spin.setToolTip("-1 = same as weekdays.\nOnly used with a manual cap (>0).")
+
+    max_early_label = QLabel("Max days a review may be moved earlier:")
+    max_early_spin = QSpinBox()
+    max_early_spin.setRange(-1, 3650)
+    max_early_spin.setValue(-1)
+    max_early_spin.setToolTip("-1 = unlimited.\nWhen a day is over the cap, reviews are first pulled\n"
+                              "into lighter days before it, then pushed later.")
+
+    # The simulation covers every review card; this only picks what the chart shows.
+    view_label = QLabel("Chart window (days from today):")
+    view_from_spin = QSpinBox()
+    view_from_spin.setRange(-3650, 0)
+    view_from_spin.setValue(-30)
+    view_from_spin.setPrefix("from ")
+    view_to_spin = QSpinBox()
+    view_to_spin.setRange(1, 3650)
+    view_to_spin.setValue(90)
+    view_to_spin.setPrefix("to ")
+    view_row = QHBoxLayout()
+    view_row.addWidget(view_from_spin)
+    view_row.addWidget(view_to_spin)
+
     card_count_label = QLabel("Cards in scope: 0")
     review_count_label = QLabel("Cards currently in review: 0")
+    diff_label = QLabel("")
+    diff_label.setStyleSheet("font-family: monospace;")
+    preview_status_label = QLabel("")
 
     export_mode_select = QComboBox()
     export_mode_select.addItems(["Write to current deck", "Create filtered deck"])
 
     reset_btn = QPushButton("Reset Sliders")
     preview_btn = QPushButton("Preview")
+    explore_btn = QPushButton("Explore Settings…")
+    explore_btn.setToolTip("Compare peak load, tail length and displacement over a grid\n"
+                           "of stretch / shift / cap settings.")
+    groups_btn = QPushButton("Deck Groups…")
+    groups_btn.setToolTip("Warp several decks with their own stretch, shift and cap\n"
+                          "under one shared daily budget.")
     apply_changes_btn = QPushButton("Apply Changes")
+    revert_btn = QPushButton("Revert a Warp…")
+    revert_btn.setToolTip("Put the cards of an earlier warp back on their previous due dates.\n"
+                          "Works after restarts and syncs, unlike Edit > Undo.")
 
     scroll_layout.addWidget(slider_stretch_label)
     scroll_layout.addWidget(slider_stretch)
@@ -236,13 +416,54 @@ def launch_timewarp():
     scroll_layout.addWidget(checkbox_set_new)
     scroll_layout.addWidget(max_per_day_label)
     scroll_layout.addWidget(max_per_day_spin)
+    scroll_layout.addWidget(weekend_cap_label)
+    scroll_layout.addWidget(weekend_cap_spin)
+    scroll_layout.addWidget(max_early_label)
+    scroll_layout.addWidget(max_early_spin)
+    scroll_layout.addWidget(view_label)
+    scroll_layout.addLayout(view_row)
     scroll_layout.addWidget(reset_btn)
     scroll_layout.addWidget(card_count_label)
     scroll_layout.addWidget(review_count_label)
+    scroll_layout.addWidget(diff_label)
+    scroll_layout.addWidget(preview_status_label)
     scroll_layout.addWidget(QLabel("Select Export Mode:"))
     scroll_layout.addWidget(export_mode_select)
     scroll_layout.addWidget(preview_btn)
+    scroll_layout.addWidget(explore_btn)
+    scroll_layout.addWidget(groups_btn)
     scroll_layout.addWidget(apply_changes_btn)
+    scroll_layout.addWidget(revert_btn)
+
+    # Performance panel: opt-in stage timings, collapsed by default
+    metrics_log_path = os.path.join(addon_dir, "user_files", "timewarp_metrics.jsonl")
+    perf_toggle = QToolButton()
+    perf_toggle.setText("Performance")
+    perf_toggle.setCheckable(True)
+    perf_toggle.setToolButtonStyle(Qt.ToolButtonStyle.ToolButtonTextBesideIcon)
+    perf_toggle.setArrowType(Qt.ArrowType.RightArrow)
+
+    perf_panel = QWidget()
+    perf_layout = QVBoxLayout(perf_panel)
+    perf_layout.setContentsMargins(0, 0, 0, 0)
+    checkbox_record = QCheckBox("Record stage timings and peak memory")
+    checkbox_record.setChecked(instrumentation.enabled)
+    checkbox_record.setToolTip("Peak memory tracking slows the preview down noticeably.")
+    checkbox_log = QCheckBox("Also append runs to user_files/timewarp_metrics.jsonl")
+    checkbox_log.setChecked(instrumentation.log_path is not None)
+    perf_text = QPlainTextEdit()
+    perf_text.setReadOnly(True)
+    perf_text.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
+    perf_text.setMinimumHeight(160)
+    perf_text.setStyleSheet("font-family: monospace;")
+    perf_text.setPlainText(instrumentation.summary())
+    perf_layout.addWidget(checkbox_record)
+    perf_layout.addWidget(checkbox_log)
+    perf_layout.addWidget(perf_text)
+    perf_panel.setVisible(False)
+
+    scroll_layout.addWidget(perf_toggle)
+    scroll_layout.addWidget(perf_panel)
 
     scroll_area.setWidget(scroll_content)
     main_layout.addWidget(scroll_area)
@@ -251,6 +472,54 @@ def launch_timewarp():
     webview.setFixedSize(1000, 400)
     main_layout.addWidget(webview)
 
+    # The chart page is loaded once; updates are pushed into it as JS.
+    # Pushes that arrive before the page finished loading are held back
+    # and only the newest one is replayed.
+    chart_ready = [False]
+    pending_chart_js = [None]
+
+    def push_chart(chart_js, done=None):
+        """Run *chart_js* in the page; *done* is called once it has run."""
+        if chart_ready[0]:
+            webview.page().runJavaScript(chart_js, done or (lambda _: None))
+        else:
+            pending_chart_js[0] = (chart_js, done)
+
+    def on_chart_loaded(ok):
+        chart_ready[0] = ok
+        if ok and pending_chart_js[0] is not None:
+            push_chart(*pending_chart_js[0])
+            pending_chart_js[0] = None
+
+    def refresh_perf_panel():
+        perf_text.setPlainText(instrumentation.summary())
+
+    def finish_trace(trace):
+        trace.end()
+        if instrumentation.enabled:
+            refresh_perf_panel()
+
+    def toggle_perf_panel(checked):
+        perf_panel.setVisible(checked)
+        perf_toggle.setArrowType(Qt.ArrowType.DownArrow if checked else Qt.ArrowType.RightArrow)
+
+    def set_recording(checked):
+        instrumentation.enabled = checked
+
+    def set_logging(checked):
+        instrumentation.log_path = metrics_log_path if checked else None
+
+    perf_toggle.toggled.connect(toggle_perf_panel)
+    checkbox_record.toggled.connect(set_recording)
+    checkbox_log.toggled.connect(set_logging)
+
+    open_trace = instrumentation.begin("open")
+    with open_trace.stage("html build"):
+        chart_html = build_chart_html()
+    finish_trace(open_trace)
+    webview.loadFinished.connect(on_chart_loaded)
+    webview.setHtml(chart_html)
+
     # FIX 3: debounce timer – chart only redraws after 200ms of inactivity
     debounce_timer = QTimer()
     debounce_timer.setSingleShot(True)
@@ -262,92 +531,231 @@ def launch_timewarp():
 
     def schedule_update():
         """Reset the debounce timer on every parameter change."""
+        nonlocal card_data_transformed
+        card_data_transformed = None  # no apply until the preview caught up
+        if diff_label.text():
+            diff_label.setText("Cards to rewrite: …")
         debounce_timer.start()
 
+    def inputs_changed():
+        """A non-slider input changed: cached slider positions no longer apply."""
+        preview_cache.clear()
+        schedule_update()
+
+    def start_precompute():
+        positions = nearby_positions(
+            slider_stretch.value(), slider_shift.value(),
+            (slider_stretch.minimum(), slider_stretch.maximum()),
+            (slider_shift.minimum(), slider_shift.maximum()))
+        # pure simulation on the cached snapshot, so it need not queue
+        # behind collection ops on the collection worker
+        mw.taskman.run_in_background(lambda: preview_cache.precompute(positions),
+                                     uses_collection=False)
+
+    def scrub():
+        """
+        Slider moved: draw the chart from the preview cache right away when
+        the position is cached, then refresh the full preview as usual.
+        """
+        entry = preview_cache.get(slider_stretch.value(), slider_shift.value())
+        if entry is not None and preview_timeline[0] is not None:
+            first_offset, counts = entry
+            timeline = (counts, first_offset) + preview_timeline[0][2:]
+            preview_timeline[0] = timeline
+            view = (view_from_spin.value(), view_to_spin.value())
+            chart_y_max[0], chart_js = timeline_chart_js(timeline, view, chart_y_max[0])
+            review_count_label.setText(f"Cards currently in review: {sum(counts)}")
+            push_chart(chart_js)
+            start_precompute()
+        schedule_update()
+
     def update_graph():
-        nonlocal card_data_transformed
+        """
+        Recompute the preview in a background op.
 
-        horizon_past = 30
-        horizon_future = 90
+        Every call bumps preview_generation; a run that is no longer the
+        newest gives up at the next stage boundary and its result is never
+        rendered, so only the latest slider value reaches the chart.
+        """
+        nonlocal card_data_transformed
+        card_data_transformed = None
 
         deck = deck_select.currentText()
-        tags = tag_widget.get_tags()
+        tags = list(tag_widget.get_tags())
         stretch = slider_stretch.value()
         shift = slider_shift.value()
-        collapse_overdues = checkbox_collapse_overdues.isChecked()
         max_cap = int(max_per_day_spin.value())
-
-        cids = fetch_cards(deck, tags)
-        card_count_label.setText(f"Cards in scope: {len(cids)}")
-        card_data = get_card_data(cids)
-
-        card_data_transformed = simulate_review_timeline(
-            card_data,
-            stretch_pct=stretch,
-            shift=shift,
-            horizon_past=horizon_past,
-            horizon_future=horizon_future,
-            collapse_overdues=collapse_overdues,
+        weekend_cap = int(weekend_cap_spin.value())
+        max_early = int(max_early_spin.value())
+        day_capacity = None
+        if max_cap > 0 and weekend_cap >= 0:
+            day_capacity = weekly_capacity(max_cap, weekend_cap, scheduler_weekday(mw.col))
+        # everything but the two sliders; also the preview cache context
+        sim_params = dict(
+            horizon_past=30,
+            horizon_future=90,
+            fit_horizon=True,
+            collapse_overdues=checkbox_collapse_overdues.isChecked(),
             max_cards_per_day=max_cap,
+            day_capacity=day_capacity,
+            max_displacement=max_early if max_early >= 0 else None,
         )
-
-        matrix_transformed = compute_due_matrix(card_data_transformed, 0)
-        hist_transformed = sum_matrix_columns(matrix_transformed)
-        review_count_label.setText(f"Cards currently in review: {sum(hist_transformed)}")
-
-        # Chart: always show base horizon, stable Y-axis
-        base_horizon = horizon_past + horizon_future
-        chart_hist = hist_transformed[:base_horizon]
-        while len(chart_hist) < base_horizon:
-            chart_hist.append(0)
-
-        # Y-axis stability: only rescale upward when peak > 75% of current max
-        current_peak = max(chart_hist) if chart_hist else 0
-        if chart_y_max[0] == 0:
-            # First render: set y_max to peak with 10% headroom
-            chart_y_max[0] = max(1, int(current_peak * 1.1))
-        elif current_peak > chart_y_max[0] * 0.75:
-            # Peak grew beyond 75% of Y-axis: rescale up
-            chart_y_max[0] = max(chart_y_max[0], int(current_peak * 1.1))
-        # Otherwise: keep current y_max (bars shrink within stable axis)
-
-        labels = [str(i - horizon_past) for i in range(base_horizon)]
-        html = build_chart_html(chart_hist, labels, max_cap=max_cap, y_max=chart_y_max[0])
-        webview.setHtml(html)
+        view = (view_from_spin.value(), view_to_spin.value())
+        y_max_before = chart_y_max[0]
+
+        preview_generation[0] += 1
+        generation = preview_generation[0]
+        preview_status_label.setText("Computing…")
+        trace = instrumentation.begin("preview", deck=deck, stretch=stretch, shift=shift,
+                                      cap=max_cap)
+
+        def is_stale():
+            return generation != preview_generation[0]
+
+        def compute(col):
+            if is_stale():
+                return None
+            card_data = snapshot_cache.get(deck, tags, trace=trace)
+            card_count = len(card_data)
+            if is_stale():
+                return None
+            card_data = simulate_review_timeline(
+                card_data,
+                stretch_pct=stretch,
+                shift=shift,
+                pipeline=preview_pipeline,
+                trace=trace,
+                **sim_params,
+            )
+            if is_stale():
+                return None
+            preview_cache.reset(card_data, col.sched.today, **sim_params)
+            with trace.stage("chart data"):
+                timeline = (timeline_histogram(card_data), card_data.first_day - col.sched.today,
+                            max_cap, day_capacity)
+                y_max, chart_js = timeline_chart_js(timeline, view, y_max_before)
+            with trace.stage("diff"):
+                diff = due_date_diff(card_data)
+                diff_text = diff_summary_text(len(diff[0]), len(card_data.placed_indices()),
+                                              displacement_histogram(diff[1], diff[2]))
+            return card_count, card_data, timeline, y_max, chart_js, diff, diff_text
+
+        def render(result):
+            nonlocal card_data_transformed, card_diff
+            if result is None or is_stale():
+                return
+            card_count, card_data, timeline, y_max, chart_js, diff, diff_text = result
+            card_data_transformed = card_data
+            card_diff = diff
+            diff_label.setText(diff_text)
+            preview_timeline[0] = timeline
+            chart_y_max[0] = y_max
+            review_count = sum(timeline[0])
+            card_count_label.setText(f"Cards in scope: {card_count}")
+            review_count_label.setText(f"Cards currently in review: {review_count}")
+            preview_status_label.setText("")
+            render_start = time.perf_counter()
+
+            def rendered(_):
+                trace.record("chart render", time.perf_counter() - render_start)
+                finish_trace(trace)
+
+            push_chart(chart_js, rendered)
+            start_precompute()
+
+        def failed(exc):
+            if not is_stale():
+                preview_status_label.setText("Preview failed.")
+            showWarning(str(exc), parent=dialog_instance)
+
+        QueryOp(parent=dialog_instance, op=compute, success=render).failure(failed).run_in_background()
+
+    def timeline_chart_js(timeline, view, y_max_before):
+        """(y_max, chart JS) showing the *view* window of a simulated timeline."""
+        hist, first_offset, max_cap, day_capacity = timeline
+        chart_hist, labels, cap_line = chart_window(hist, first_offset, view[0], view[1],
+                                                    max_cap, day_capacity)
+        # stable Y-axis: only rescale when the peak grows
+        y_max = next_y_max(y_max_before, max(chart_hist, default=0))
+        return y_max, chart_update_js(chart_hist, labels, max_cap=cap_line, y_max=y_max)
+
+    def update_chart_view():
+        """Show another window of the current preview without re-simulating."""
+        if preview_timeline[0] is None:
+            return
+        view = (view_from_spin.value(), view_to_spin.value())
+        chart_y_max[0], chart_js = timeline_chart_js(preview_timeline[0], view, 0)
+        push_chart(chart_js)
+
+    sweep_dialog = [None]
+
+    def explore_settings():
+        max_cap = int(max_per_day_spin.value())
+        weekend_cap = int(weekend_cap_spin.value())
+        max_early = int(max_early_spin.value())
+        caps = [-1, 0] + ([max_cap] if max_cap > 0 else [])
+        day_capacity = None
+        if max_cap > 0 and weekend_cap >= 0:
+            day_capacity = weekly_capacity(max_cap, weekend_cap, scheduler_weekday(mw.col))
+        if sweep_dialog[0] is not None:
+            sweep_dialog[0].close()
+        sweep_dialog[0] = SweepDialog(
+            deck_select.currentText(), tag_widget.get_tags(), caps,
+            collapse_overdues=checkbox_collapse_overdues.isChecked(),
+            max_displacement=max_early if max_early >= 0 else None,
+            day_capacity=day_capacity, parent=dialog_instance)
+        sweep_dialog[0].settingsPicked.connect(use_settings)
+        sweep_dialog[0].show()
+
+    groups_dialog = [None]
+
+    def open_groups():
+        max_early = int(max_early_spin.value())
+        names = [deck_select.itemText(i) for i in range(1, deck_select.count())]
+        current = deck_select.currentText()
+        decks = subdecks(names, current) or ([current] if current in names else names[:1])
+        if groups_dialog[0] is not None:
+            groups_dialog[0].close()
+        groups_dialog[0] = GroupsDialog(
+            names, decks, tag_widget.get_tags(),
+            dict(stretch_pct=slider_stretch.value(), shift=slider_shift.value(),
+                 max_cards_per_day=int(max_per_day_spin.value()),
+                 collapse_overdues=checkbox_collapse_overdues.isChecked(),
+                 max_displacement=max_early if max_early >= 0 else None),
+            parent=dialog_instance)
+        groups_dialog[0].writeRequested.connect(write_groups)
+        groups_dialog[0].show()
+
+    def write_groups(batches):
+        diff = merge_diffs(due_date_diff(batch) for batch in batches)
+        if not diff[0]:
+            tooltip("Nothing to write – no due date changes.", parent=groups_dialog[0])
+            return
+        groups = groups_dialog[0].groups()
+        confirm_changes(batches, diff, journal_meta=dict(
+            deck=", ".join(deck for deck, _ in groups), tags=list(tag_widget.get_tags()),
+            groups=[dict(deck=deck, stretch=params["stretch_pct"], shift=params["shift"],
+                         cap=params["max_cards_per_day"]) for deck, params in groups],
+            budget=groups_dialog[0].budget_spin.value()))
+
+    def use_settings(stretch, shift, cap):
+        slider_stretch.setValue(stretch)
+        slider_shift.setValue(shift)
+        max_per_day_spin.setValue(cap)
 
     def apply_changes():
         today = date.today()
         mode = export_mode_select.currentText()
 
-        changes_preview = []
-        for entry in card_data_transformed:
-            original = entry["original_due"]
-            new = entry["due"]
-            changes_preview.append(f"{{cardID: {entry['cid']}, original: {original}, new: {new}}}")
-
-        print("\n\nPending changes to be applied:")
-        print("\n".join(changes_preview))
+        if card_data_transformed is None:
+            tooltip("Wait for the preview to finish.", parent=dialog_instance)
+            return
 
         if mode == "Write to current deck":
-            reply = QMessageBox.question(
-                dialog_instance,
-                "Review Changes",
-                "You are about to introduce changes into the review data of the selected deck."
-                " Undoing the changes is possible until you sync. Proceed?",
-                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
-            )
-            if reply == QMessageBox.StandardButton.Yes:
-                apply_transformed_due_dates(card_data_transformed)
-                if checkbox_shuffle.isChecked():
-                    shuffle_cards(card_data_transformed)
-                if checkbox_set_new.isChecked():
-                    set_cards_as_new(card_data_transformed)
-                mw.reset()
-                QMessageBox.information(
-                    dialog_instance,
-                    "Success",
-                    "Review dates have been updated. Undo from (Edit > Undo Time Warp)",
-                )
+            if not len(card_diff[0]):
+                tooltip("Nothing to write – no due date changes.", parent=dialog_instance)
+                return
+            confirm_changes([card_data_transformed], card_diff)
 
         elif mode == "Create filtered deck":
             reply = QMessageBox.question(
@@ -357,13 +765,195 @@ def launch_timewarp():
                 QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
             )
             if reply == QMessageBox.StandardButton.Yes:
-                create_filtered_deck_from_transformed(card_data_transformed)
+                expected = len(card_data_transformed.placed_indices())
+                try:
+                    dids, moved = create_filtered_deck_from_transformed(
+                        card_data_transformed, deck_name="TimeWarpFiltered")
+                except ValueError as exc:
+                    QMessageBox.warning(dialog_instance, "Filtered Deck", str(exc))
+                    return
+                snapshot_cache.invalidate()
                 if checkbox_shuffle.isChecked():
                     shuffle_cards(card_data_transformed)
                 if checkbox_set_new.isChecked():
                     set_cards_as_new(card_data_transformed)
                 mw.reset()
-                QMessageBox.information(dialog_instance, "Filtered Deck Created", "Filtered deck with transformed due dates has been created.")
+                message = f"{moved} cards with transformed due dates were placed in {len(dids)} filtered deck(s)."
+                if moved < expected:
+                    message += (f"\n\n{expected - moved} cards were skipped because they are"
+                                " already in another filtered deck.")
+                QMessageBox.information(dialog_instance, "Filtered Deck Created", message)
+
+    def confirm_changes(batches, diff, journal_meta=None):
+        """
+        List the pending changes of *diff* in a ChangePreviewDialog and
+        write them if the user accepts, see write_due_dates_in_background().
+        Deck ids are loaded in the background first, for the deck column
+        and filter.
+        """
+        cids, old_dues, new_dues = diff
+
+        def load(col):
+            dids = load_card_decks(cids)
+            names = {did: col.decks.name(did) for did in set(dids.tolist())}
+            return dids, names, scheduler_day_zero(col.sched.day_cutoff, col.sched.today)
+
+        def loaded(result):
+            dids, names, day_zero = result
+            model = ChangeTableModel(cids, dids, old_dues, new_dues, names, day_zero)
+            preview = ChangePreviewDialog(
+                model,
+                f"You are about to change the due dates of {len(cids)} cards."
+                " Undoing the changes is possible until you sync.",
+                parent=dialog_instance)
+            if preview.exec() == QDialog.DialogCode.Accepted:
+                write_due_dates_in_background(batches, diff, journal_meta)
+
+        def failed(exc):
+            showWarning(str(exc), parent=dialog_instance)
+
+        QueryOp(parent=dialog_instance, op=load, success=loaded).failure(failed).run_in_background()
+
+    def write_due_dates_in_background(batches, diff, journal_meta=None):
+        """
+        Write the (cids, old dues, new dues) *diff* of the simulated
+        *batches* in a CollectionOp, so Anki refreshes its undo menu and
+        open screens itself.  The Cancel button added to Anki's progress
+        window (or Esc) stops the write and puts the cards written so far
+        back.  *journal_meta* describes the warp in the journal; by default
+        the main dialog's settings.  Afterwards Apply waits for a fresh
+        preview, so the written slots cannot be written a second time.
+        """
+        cids, old_dues, new_dues = diff
+        total = len(cids)
+        if journal_meta is None:
+            journal_meta = dict(deck=deck_select.currentText(), tags=list(tag_widget.get_tags()),
+                                stretch=slider_stretch.value(), shift=slider_shift.value(),
+                                cap=int(max_per_day_spin.value()))
+        apply_changes_btn.setEnabled(False)
+        trace = instrumentation.begin("apply", cards=total)
+        outcome = {}  # count and journal error, filled in by the op
+        cancel_btn = [None]
+
+        def add_cancel_button():
+            # Anki's progress window only cancels on Esc or close; it has
+            # no public way to add a button, so one goes into its layout.
+            win = getattr(mw.progress, "_win", None)
+            if win is None or win.layout() is None or cancel_btn[0] is not None:
+                return
+            cancel_btn[0] = QPushButton("Cancel", win)
+            cancel_btn[0].clicked.connect(lambda: setattr(win, "wantCancel", True))
+            win.layout().addWidget(cancel_btn[0])
+
+        def show_progress(done):
+            mw.progress.update(label=f"Time Warp: {done} / {total} cards",
+                               value=done, max=total)
+            add_cancel_button()
+
+        def report_progress(done, _total):
+            mw.taskman.run_on_main(lambda: show_progress(done))
+
+        def write(col):
+            with trace.stage("apply"):
+                count, changes = write_due_dates(cids, new_dues, progress=report_progress,
+                                                 should_cancel=mw.progress.want_cancel,
+                                                 return_changes=True)
+            outcome["count"] = count
+            outcome["journal_error"] = None
+            with trace.stage("journal"):
+                try:
+                    record_warp(journal_dir(), cids, old_dues, new_dues, **journal_meta)
+                except Exception as exc:  # the due dates are written either way
+                    outcome["journal_error"] = exc
+            return changes or OpChanges()
+
+        def finish():
+            apply_changes_btn.setEnabled(True)
+            snapshot_cache.invalidate()
+            finish_trace(trace)
+            cards_rewritten()
+
+        def written(_changes):
+            count, journal_error = outcome["count"], outcome["journal_error"]
+            finish()
+            for batch in batches:
+                if checkbox_shuffle.isChecked():
+                    shuffle_cards(batch)
+                if checkbox_set_new.isChecked():
+                    set_cards_as_new(batch)
+            QMessageBox.information(
+                dialog_instance,
+                "Success",
+                f"Review dates of {count} cards have been updated. Undo from (Edit > Undo Time Warp)",
+            )
+            if journal_error is not None:
+                showWarning(
+                    f"The warp was applied, but it could not be saved to the journal"
+                    f" ({journal_error}), so \"Revert a Warp\" will not offer it."
+                    " Edit > Undo still works until you sync.",
+                    parent=dialog_instance)
+
+        def failed(exc):
+            finish()
+            if isinstance(exc, ApplyCancelled):
+                tooltip("Time Warp cancelled – no due dates were changed.", parent=dialog_instance)
+            else:
+                showWarning(str(exc), parent=dialog_instance)
+
+        CollectionOp(parent=dialog_instance, op=write).success(written).failure(failed).run_in_background()
+
+    def cards_rewritten():
+        """The cards were rewritten: drop the previews of their old due dates."""
+        inputs_changed()
+        if groups_dialog[0] is not None:
+            groups_dialog[0].settings_changed()
+
+    def journal_dir():
+        """Warp journals of the current profile."""
+        return os.path.join(addon_dir, "user_files", "journal", mw.pm.name)
+
+    def revert_changes():
+        warps = list_warps(journal_dir())
+        if not warps:
+            tooltip("No warps have been recorded for this profile yet.", parent=dialog_instance)
+            return
+        items = []
+        for number, warp in enumerate(warps, start=1):
+            meta = warp["meta"]
+            created = time.strftime("%Y-%m-%d %H:%M", time.localtime(warp["created"]))
+            if "groups" in meta:
+                settings = f"{len(meta['groups'])} deck groups"
+            else:
+                settings = f"stretch {meta.get('stretch', 0)}%, shift {meta.get('shift', 0)}"
+            items.append(f"{number}. {created} – {meta.get('deck', '?')}, {warp['cards']} cards"
+                         f" ({settings})")
+        choice, ok = QInputDialog.getItem(dialog_instance, "Revert a Warp",
+                                          "Warp to revert (newest first):", items, 0, False)
+        if not ok:
+            return
+        path = warps[items.index(choice)]["path"]
+
+        outcome = {}  # (reverted, skipped), filled in by the op
+
+        def revert(col):
+            reverted_count, skipped, changes = revert_warp(path, return_changes=True)
+            outcome["result"] = (reverted_count, skipped)
+            return changes or OpChanges()
+
+        def reverted(_changes):
+            count, skipped = outcome["result"]
+            snapshot_cache.invalidate()
+            cards_rewritten()
+            message = f"{count} cards are back on their previous due dates."
+            if skipped:
+                message += (f"\n\n{skipped} cards were left alone because they were reviewed,"
+                            " rescheduled or deleted after the warp.")
+            QMessageBox.information(dialog_instance, "Warp Reverted", message)
+
+        def failed(exc):
+            showWarning(str(exc), parent=dialog_instance)
+
+        CollectionOp(parent=dialog_instance, op=revert).success(reverted).failure(failed).run_in_background()
 
     def reset_sliders():
         slider_stretch.setValue(0)
@@ -375,15 +965,39 @@ def launch_timewarp():
 
     slider_stretch.valueChanged.connect(update_labels)
     slider_shift.valueChanged.connect(update_labels)
-    slider_stretch.valueChanged.connect(schedule_update)
-    slider_shift.valueChanged.connect(schedule_update)
-    max_per_day_spin.valueChanged.connect(schedule_update)
-    deck_select.currentIndexChanged.connect(lambda: (chart_y_max.__setitem__(0, 0), schedule_update()))
-    checkbox_collapse_overdues.stateChanged.connect(schedule_update)
+    slider_stretch.valueChanged.connect(scrub)
+    slider_shift.valueChanged.connect(scrub)
+    max_per_day_spin.valueChanged.connect(inputs_changed)
+    weekend_cap_spin.valueChanged.connect(inputs_changed)
+    max_early_spin.valueChanged.connect(inputs_changed)
+    tag_widget.tagChanged.connect(inputs_changed)
+    view_from_spin.valueChanged.connect(update_chart_view)
+    view_to_spin.valueChanged.connect(update_chart_view)
+    deck_select.currentIndexChanged.connect(lambda: (chart_y_max.__setitem__(0, 0), inputs_changed()))
+    checkbox_collapse_overdues.stateChanged.connect(inputs_changed)
     preview_btn.clicked.connect(update_graph)       # Preview = immediate
+    explore_btn.clicked.connect(explore_settings)
+    groups_btn.clicked.connect(open_groups)
     reset_btn.clicked.connect(reset_sliders)
     apply_changes_btn.clicked.connect(apply_changes)
+    revert_btn.clicked.connect(revert_changes)
+
+    def reopen():
+        """Catch up with changes made to the collection while hidden."""
+        names = ["All"] + [d.name for d in mw.col.decks.all_names_and_ids()]
+        if names != [deck_select.itemText(i) for i in range(deck_select.count())]:
+            current = deck_select.currentText()
+            deck_select.blockSignals(True)
+            deck_select.clear()
+            deck_select.addItems(names)
+            deck_select.setCurrentIndex(max(0, deck_select.findText(current)))
+            deck_select.blockSignals(False)
+        clear_tag_indexes()  # tags may have been added or renamed
+        tag_widget.reset_index()
+        if preview_timeline[0] is not None:
+            inputs_changed()  # reviews since the last preview make it stale
 
     dialog_instance.setLayout(main_layout)
-    dialog_instance.finished.connect(lambda: clear_dialog_instance())
+    dialog_instance.reopen = reopen
+    dialog_instance.finished.connect(debounce_timer.stop)
     dialog_instance.exec()